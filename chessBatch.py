@@ -0,0 +1,149 @@
+"""
+Headless batch analysis - searches every position of an EPD/FEN file on a pool of worker processes
+and streams one JSON line per position back in completion order.
+
+Usage: python chessBatch.py POSITIONS [--depth N | --time-ms MS] [--workers N] [--chunk-size N]
+                            [--backend list|bitboard] [--output FILE]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from itertools import islice
+from multiprocessing import Event
+
+import chessEngine
+import chessEpd
+import chessSearch
+
+defaultDepth = 4 # Used when neither a depth nor a time limit is given
+
+# Per-process state, created once by initWorker and kept warm across chunks
+workerSearch = None
+workerBackend = "list"
+workerStop = None
+
+'''
+Runs once in every worker process - builds the attack tables and a Search (with its
+transposition table and history) that all chunks sent to this process reuse.
+'''
+def initWorker(backend, ttSize, stopEvent):
+    global workerSearch, workerBackend, workerStop
+    workerBackend = backend
+    workerStop = stopEvent
+    chessEngine.GameState(backend=backend)
+    workerSearch = chessSearch.Search(chessSearch.TranspositionTable(ttSize))
+    workerSearch.stopEvent = stopEvent
+
+'''
+Searches one chunk of (index, fen, operations) and returns a result dict per position.
+A bad position - an unparsable line (operations is then its ValueError), a bad FEN or anything
+else the engine raises on it - is reported with an "error" key instead of failing the whole chunk.
+Stops early, with the results so far, once the batch is cancelled.
+'''
+def analyzeChunk(chunk, depth, timeMs):
+    results = []
+    for index, fen, operations in chunk:
+        if workerStop is not None and workerStop.is_set():
+            break
+        result = {"index": index, "fen": fen}
+        if isinstance(operations, ValueError):
+            result["error"] = str(operations)
+            results.append(result)
+            continue
+        if "id" in operations:
+            result["id"] = " ".join(operations["id"])
+        try:
+            gs = chessEngine.GameState(backend=workerBackend, fen=fen)
+            code, score, info = workerSearch.iterativeDeepening(gs, timeMs, depth if depth else chessSearch.maxPly)
+        except Exception as e:
+            result["error"] = str(e) or type(e).__name__
+            results.append(result)
+            continue
+        result.update({
+            "bestMove": chessEngine.Move.fromCode(code, gs.board).getUciNotation() if code else None,
+            "score": score, "depth": info["depth"], "nodes": info["nodes"],
+            "timeMs": info["timeMs"], "pv": chessSearch.pvToUci(gs, info["pv"]),
+        })
+        results.append(result)
+    return results
+
+
+'''
+Yields a result dict per position as soon as its chunk finishes (completion order, not input order).
+positions is any iterable of (fen, operations), as from chessEpd.readPositions(path, errors=True),
+and is read lazily - at most two chunks per worker are queued at a time. Without a depth or time
+limit every position is searched to defaultDepth. Closing the generator (or Ctrl+C) cancels the
+queued chunks and stops the running ones.
+'''
+def analyzePositions(positions, depth=None, timeMs=None, workers=None, chunkSize=16, backend="list", ttSize=1 << 16):
+    workers = workers or os.cpu_count() or 1
+    if depth is None and timeMs is None:
+        depth = defaultDepth
+    numbered = ((index, fen, operations) for index, (fen, operations) in enumerate(positions))
+    stopEvent = Event()
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=initWorker, initargs=(backend, ttSize, stopEvent))
+    pending = set()
+    try:
+        while True:
+            while len(pending) < workers * 2:
+                chunk = list(islice(numbered, chunkSize))
+                if not chunk:
+                    break
+                pending.add(executor.submit(analyzeChunk, chunk, depth, timeMs))
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                for result in future.result():
+                    yield result
+    finally:
+        stopEvent.set()
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyse many positions in parallel")
+    parser.add_argument("positions", help="EPD or FEN file, one position per line (.gz allowed)")
+    limit = parser.add_mutually_exclusive_group()
+    limit.add_argument("--depth", type=int, help="search every position to this depth")
+    limit.add_argument("--time-ms", type=int, help="search every position for this many milliseconds")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes (default: all cores)")
+    parser.add_argument("--chunk-size", type=int, default=16, help="positions sent to a worker at a time")
+    parser.add_argument("--backend", choices=["list", "bitboard"], default="bitboard")
+    parser.add_argument("--output", help="write JSON lines here instead of stdout")
+    args = parser.parse_args(argv)
+    depth = args.depth if args.depth or args.time_ms else defaultDepth
+
+    out = open(args.output, "w") if args.output else sys.stdout
+    start = time.perf_counter()
+    positions = nodes = errors = 0
+    results = analyzePositions(chessEpd.readPositions(args.positions, errors=True), depth, args.time_ms,
+                               args.workers, args.chunk_size, args.backend)
+    try:
+        for result in results:
+            out.write(json.dumps(result) + "\n")
+            out.flush()
+            positions += 1
+            nodes += result.get("nodes", 0)
+            errors += "error" in result
+    except KeyboardInterrupt:
+        results.close()
+        print("Cancelled", file=sys.stderr)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    seconds = time.perf_counter() - start
+    print("%d positions (%d errors) in %.2fs - %.1f positions/s, %d nodes, %d nps with %d workers" % (
+        positions, errors, seconds, positions / seconds if seconds else 0, nodes,
+        nodes / seconds if seconds else 0, args.workers), file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
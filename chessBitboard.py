@@ -0,0 +1,386 @@
+"""
+Bitboard backend for GameState.
+Keeps one 64-bit mask per piece type and generates moves from precomputed attack tables
+instead of scanning the 8x8 list square by square.
+"""
+
+# Square index = row * 8 + col, so bit 0 is a8 and bit 63 is h1 (same layout as GameState.board).
+pieceNames = ['wp','wN','wB','wR','wQ','wK','bp','bN','bB','bR','bQ','bK']
+fullBoard = (1 << 64) - 1
+sqToRowCol = [divmod(sq, 8) for sq in range(64)]
+
+# Move codes, shared by both GameState backends:
+# bits 0-5 start square, 6-11 end square, 12-14 promotion piece (1=N, 2=B, 3=R, 4=Q), then the flags.
+promotionShift = 12
+enPassantFlag = 1 << 15
+castleFlag = 1 << 16
+captureFlag = 1 << 17
+promotionCodes = (4 << promotionShift, 3 << promotionShift, 2 << promotionShift, 1 << promotionShift) # Queen first
+promotionNames = ('', 'N', 'B', 'R', 'Q')
+
+knightAttacks = []
+kingAttacks = []
+pawnAttacks = {'w': [], 'b': []}
+rookMasks = []
+bishopMasks = []
+rookTables = []   # rookTables[sq][occupancy & rookMasks[sq]] -> attack mask
+bishopTables = [] # bishopTables[sq][occupancy & bishopMasks[sq]] -> attack mask
+betweenMasks = [] # betweenMasks[a][b] -> squares strictly between a and b if they share a line
+lineMasks = []    # lineMasks[a][b] -> the whole line through a and b if they share one
+
+rookDirections = ((-1,0),(1,0),(0,-1),(0,1))
+bishopDirections = ((-1,-1),(-1,1),(1,-1),(1,1))
+
+
+def stepAttacks(sq, offsets):
+    r, c = sqToRowCol[sq]
+    mask = 0
+    for dr, dc in offsets:
+        if 0 <= r + dr < 8 and 0 <= c + dc < 8:
+            mask |= 1 << ((r + dr) * 8 + c + dc)
+    return mask
+
+'''
+Walks each ray until it runs into a piece (the blocker itself is attacked).
+Only used while building the tables.
+'''
+def slowSlidingAttacks(sq, occupancy, directions):
+    r, c = sqToRowCol[sq]
+    mask = 0
+    for dr, dc in directions:
+        endRow, endCol = r + dr, c + dc
+        while 0 <= endRow < 8 and 0 <= endCol < 8:
+            bit = 1 << (endRow * 8 + endCol)
+            mask |= bit
+            if occupancy & bit:
+                break
+            endRow += dr
+            endCol += dc
+    return mask
+
+'''
+Squares whose occupancy can change the attack set (the last square of every ray is left out).
+'''
+def relevantMask(sq, directions):
+    r, c = sqToRowCol[sq]
+    mask = 0
+    for dr, dc in directions:
+        endRow, endCol = r + dr, c + dc
+        while 0 <= endRow + dr < 8 and 0 <= endCol + dc < 8:
+            mask |= 1 << (endRow * 8 + endCol)
+            endRow += dr
+            endCol += dc
+    return mask
+
+'''
+Enumerates every subset of the relevant mask (carry-rippler) and stores its attack set.
+The dict keyed by masked occupancy plays the role of the magic-number index.
+'''
+def buildSlidingTable(sq, mask, directions):
+    table = {}
+    subset = 0
+    while True:
+        table[subset] = slowSlidingAttacks(sq, subset, directions)
+        subset = (subset - mask) & mask
+        if subset == 0:
+            break
+    return table
+
+'''
+Builds all attack tables. Called once, the first time a bitboard GameState is created.
+'''
+def initTables():
+    if knightAttacks:
+        return
+    for sq in range(64):
+        knightAttacks.append(stepAttacks(sq, ((-2,-1),(-2,1),(2,-1),(2,1),(1,2),(1,-2),(-1,2),(-1,-2))))
+        kingAttacks.append(stepAttacks(sq, ((1,1),(1,-1),(1,0),(0,1),(0,-1),(-1,-1),(-1,0),(-1,1))))
+        pawnAttacks['w'].append(stepAttacks(sq, ((-1,-1),(-1,1))))
+        pawnAttacks['b'].append(stepAttacks(sq, ((1,-1),(1,1))))
+        rookMasks.append(relevantMask(sq, rookDirections))
+        bishopMasks.append(relevantMask(sq, bishopDirections))
+        rookTables.append(buildSlidingTable(sq, rookMasks[sq], rookDirections))
+        bishopTables.append(buildSlidingTable(sq, bishopMasks[sq], bishopDirections))
+    for sq in range(64):
+        between = [0] * 64
+        line = [0] * 64
+        r, c = sqToRowCol[sq]
+        for dr, dc in rookDirections + bishopDirections:
+            fullLine = slowSlidingAttacks(sq, 0, ((dr, dc), (-dr, -dc))) | (1 << sq)
+            ray = 0
+            endRow, endCol = r + dr, c + dc
+            while 0 <= endRow < 8 and 0 <= endCol < 8:
+                endSq = endRow * 8 + endCol
+                between[endSq] = ray
+                line[endSq] = fullLine
+                ray |= 1 << endSq
+                endRow += dr
+                endCol += dc
+        betweenMasks.append(between)
+        lineMasks.append(line)
+
+
+def rookAttacks(sq, occupancy):
+    return rookTables[sq][occupancy & rookMasks[sq]]
+
+def bishopAttacks(sq, occupancy):
+    return bishopTables[sq][occupancy & bishopMasks[sq]]
+
+
+class BitboardBoard():
+    def __init__(self, board):
+        initTables()
+        self.pieces = {name: 0 for name in pieceNames}
+        self.colors = {'w': 0, 'b': 0}
+        for r in range(8):
+            for c in range(8):
+                if board[r][c] != "--":
+                    self.addPiece(board[r][c], r * 8 + c)
+
+    def addPiece(self, piece, sq):
+        bit = 1 << sq
+        self.pieces[piece] |= bit
+        self.colors[piece[0]] |= bit
+
+    def removePiece(self, piece, sq):
+        bit = 1 << sq
+        self.pieces[piece] ^= bit
+        self.colors[piece[0]] ^= bit
+
+    '''
+    Mirrors GameState.makeMoveCode on the bitboards.
+    '''
+    def applyMove(self, code, pieceMoved, pieceCaptured):
+        startSq = code & 63
+        endSq = (code >> 6) & 63
+        self.removePiece(pieceMoved, startSq)
+        if code & enPassantFlag:
+            self.removePiece(pieceCaptured, (startSq & 56) | (endSq & 7))
+        elif pieceCaptured != "--":
+            self.removePiece(pieceCaptured, endSq)
+        promotion = code >> promotionShift & 7
+        if promotion:
+            self.addPiece(pieceMoved[0] + promotionNames[promotion], endSq)
+        else:
+            self.addPiece(pieceMoved, endSq)
+        if code & castleFlag:
+            self.moveCastleRook(pieceMoved[0], startSq, endSq, False)
+
+    '''
+    Mirrors GameState.undoMoveCode on the bitboards.
+    '''
+    def revertMove(self, code, pieceMoved, pieceCaptured):
+        startSq = code & 63
+        endSq = (code >> 6) & 63
+        if code & castleFlag:
+            self.moveCastleRook(pieceMoved[0], startSq, endSq, True)
+        promotion = code >> promotionShift & 7
+        if promotion:
+            self.removePiece(pieceMoved[0] + promotionNames[promotion], endSq)
+        else:
+            self.removePiece(pieceMoved, endSq)
+        if code & enPassantFlag:
+            self.addPiece(pieceCaptured, (startSq & 56) | (endSq & 7))
+        elif pieceCaptured != "--":
+            self.addPiece(pieceCaptured, endSq)
+        self.addPiece(pieceMoved, startSq)
+
+    def moveCastleRook(self, color, startSq, endSq, undo):
+        rook = color + 'R'
+        if endSq - startSq == 2: # King side
+            cornerSq, rookSq = endSq + 1, endSq - 1
+        else: # Queen side
+            cornerSq, rookSq = endSq - 2, endSq + 1
+        if undo:
+            cornerSq, rookSq = rookSq, cornerSq
+        self.removePiece(rook, cornerSq)
+        self.addPiece(rook, rookSq)
+
+    '''
+    Mask of every piece of byColor attacking sq, for the given occupancy.
+    '''
+    def attackersTo(self, sq, byColor, occupancy):
+        pieces = self.pieces
+        queens = pieces[byColor + 'Q']
+        return (pawnAttacks['b' if byColor == 'w' else 'w'][sq] & pieces[byColor + 'p']) | \
+            (knightAttacks[sq] & pieces[byColor + 'N']) | \
+            (kingAttacks[sq] & pieces[byColor + 'K']) | \
+            (rookAttacks(sq, occupancy) & (pieces[byColor + 'R'] | queens)) | \
+            (bishopAttacks(sq, occupancy) & (pieces[byColor + 'B'] | queens))
+
+    '''
+    True if any piece of byColor attacks sq.
+    Looks outward from sq with each piece's attack pattern instead of generating moves.
+    '''
+    def isSquareAttacked(self, sq, byColor):
+        pieces = self.pieces
+        occupancy = self.colors['w'] | self.colors['b']
+        # A pawn of byColor attacks sq if a pawn of the other color on sq would attack it back.
+        if pawnAttacks['b' if byColor == 'w' else 'w'][sq] & pieces[byColor + 'p']:
+            return True
+        if knightAttacks[sq] & pieces[byColor + 'N']:
+            return True
+        if kingAttacks[sq] & pieces[byColor + 'K']:
+            return True
+        queens = pieces[byColor + 'Q']
+        if rookAttacks(sq, occupancy) & (pieces[byColor + 'R'] | queens):
+            return True
+        if bishopAttacks(sq, occupancy) & (pieces[byColor + 'B'] | queens):
+            return True
+        return False
+
+    '''
+    All moves without considering checks, appended to moves as packed move codes.
+    For legal generation, targets are limited to evasionMask, pinned pieces stay on their pin line
+    and kingSq is the own king's square (the king itself is left out - see generateLegalMoves).
+    '''
+    def generateMoves(self, gs, moves, evasionMask=fullBoard, pinned=0, kingSq=-1):
+        allyColor = 'w' if gs.whitetoMove else 'b'
+        enemyColor = 'b' if gs.whitetoMove else 'w'
+        pieces = self.pieces
+        own = self.colors[allyColor]
+        enemy = self.colors[enemyColor]
+        occupancy = own | enemy
+        empty = ~occupancy & fullBoard
+        legal = kingSq >= 0
+
+        # Pawns - pushes are generated set-wise, captures from the attack table.
+        pawns = pieces[allyColor + 'p']
+        if allyColor == 'w':
+            single = (pawns >> 8) & empty
+            double = ((single & 0x0000FF0000000000) >> 8) & empty
+            step = 8
+            lastRank = 0x00000000000000FF
+        else:
+            single = (pawns << 8) & empty
+            double = ((single & 0x0000000000FF0000) << 8) & empty
+            step = -8
+            lastRank = 0xFF00000000000000
+        single &= evasionMask
+        double &= evasionMask
+        while single:
+            bit = single & -single
+            endSq = bit.bit_length() - 1
+            if not (pinned >> (endSq + step)) & 1 or bit & lineMasks[kingSq][endSq + step]:
+                code = (endSq + step) | endSq << 6
+                if bit & lastRank:
+                    for promotion in promotionCodes:
+                        moves.append(code | promotion)
+                else:
+                    moves.append(code)
+            single ^= bit
+        while double:
+            bit = double & -double
+            endSq = bit.bit_length() - 1
+            if not (pinned >> (endSq + 2 * step)) & 1 or bit & lineMasks[kingSq][endSq + 2 * step]:
+                moves.append((endSq + 2 * step) | endSq << 6)
+            double ^= bit
+        epBit = 0
+        if gs.enPassantPossible:
+            epBit = 1 << (gs.enPassantPossible[0] * 8 + gs.enPassantPossible[1])
+        attackers = pawnAttacks[allyColor]
+        while pawns:
+            bit = pawns & -pawns
+            startSq = bit.bit_length() - 1
+            targets = attackers[startSq] & ((enemy & evasionMask) | epBit)
+            if bit & pinned:
+                targets &= lineMasks[kingSq][startSq]
+            while targets:
+                target = targets & -targets
+                endSq = target.bit_length() - 1
+                code = startSq | endSq << 6 | captureFlag
+                if target == epBit:
+                    if not legal or self.enPassantIsLegal(startSq, endSq, kingSq, enemyColor, occupancy):
+                        moves.append(code | enPassantFlag)
+                elif target & lastRank:
+                    for promotion in promotionCodes:
+                        moves.append(code | promotion)
+                else:
+                    moves.append(code)
+                targets ^= target
+            pawns ^= bit
+
+        # Pieces - one attack lookup per piece, masked with the squares not occupied by our own pieces.
+        notOwn = ~own & evasionMask
+        for kind in ('NBRQ' if legal else 'NBRQK'):
+            bb = pieces[allyColor + kind]
+            while bb:
+                bit = bb & -bb
+                startSq = bit.bit_length() - 1
+                if kind == 'N':
+                    targets = knightAttacks[startSq]
+                elif kind == 'B':
+                    targets = bishopAttacks(startSq, occupancy)
+                elif kind == 'R':
+                    targets = rookAttacks(startSq, occupancy)
+                elif kind == 'Q':
+                    targets = rookAttacks(startSq, occupancy) | bishopAttacks(startSq, occupancy)
+                else:
+                    targets = kingAttacks[startSq]
+                targets &= notOwn
+                if bit & pinned:
+                    targets &= lineMasks[kingSq][startSq]
+                while targets:
+                    target = targets & -targets
+                    if target & enemy:
+                        moves.append(startSq | (target.bit_length() - 1) << 6 | captureFlag)
+                    else:
+                        moves.append(startSq | (target.bit_length() - 1) << 6)
+                    targets ^= target
+                bb ^= bit
+
+    '''
+    En passant takes two pawns off one rank at once, so it is checked against the occupancy after the capture.
+    '''
+    def enPassantIsLegal(self, startSq, endSq, kingSq, enemyColor, occupancy):
+        capturedBit = 1 << (endSq + (8 if enemyColor == 'b' else -8))
+        after = (occupancy ^ (1 << startSq) ^ capturedBit) | (1 << endSq)
+        return not (self.attackersTo(kingSq, enemyColor, after) & ~capturedBit)
+
+    '''
+    Legal moves only, as packed move codes. Checkers and pinned pieces are found once from the king's square:
+    in double check only the king moves, in single check the other pieces must capture or block,
+    and pinned pieces are restricted to the line through the king.
+    Returns True if the side to move is in check.
+    '''
+    def generateLegalMoves(self, gs, moves):
+        allyColor = 'w' if gs.whitetoMove else 'b'
+        enemyColor = 'b' if gs.whitetoMove else 'w'
+        pieces = self.pieces
+        own = self.colors[allyColor]
+        enemy = self.colors[enemyColor]
+        occupancy = own | enemy
+        kingBit = pieces[allyColor + 'K']
+        kingSq = kingBit.bit_length() - 1
+        checkers = self.attackersTo(kingSq, enemyColor, occupancy)
+
+        # King moves - the king is taken off the board so it can't shield the squares behind it.
+        withoutKing = occupancy ^ kingBit
+        targets = kingAttacks[kingSq] & ~own
+        while targets:
+            target = targets & -targets
+            endSq = target.bit_length() - 1
+            if not self.attackersTo(endSq, enemyColor, withoutKing):
+                moves.append(kingSq | endSq << 6 | (captureFlag if target & enemy else 0))
+            targets ^= target
+        if checkers & (checkers - 1):
+            return True
+
+        evasionMask = fullBoard
+        if checkers:
+            evasionMask = checkers | betweenMasks[kingSq][checkers.bit_length() - 1]
+
+        # Enemy sliders that see the king through exactly one of our pieces pin it.
+        pinned = 0
+        queens = pieces[enemyColor + 'Q']
+        snipers = (rookAttacks(kingSq, enemy) & (pieces[enemyColor + 'R'] | queens)) | \
+            (bishopAttacks(kingSq, enemy) & (pieces[enemyColor + 'B'] | queens))
+        while snipers:
+            sniper = snipers & -snipers
+            blockers = betweenMasks[kingSq][sniper.bit_length() - 1] & occupancy
+            if blockers and not blockers & (blockers - 1) and blockers & own:
+                pinned |= blockers
+            snipers ^= sniper
+
+        self.generateMoves(gs, moves, evasionMask, pinned, kingSq)
+        return checkers != 0
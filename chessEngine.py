@@ -4,9 +4,41 @@ Also responsible for determination of legal moves in the current state.
 Keeps a move log as well.
 """
 
+from array import array
+
+import chessBitboard
+import chessEval
+import chessZobrist
+from chessEval import mgTables, egTables, piecePhase
+from chessZobrist import pieceKeys, sideKey, castleKeys, enPassantKeys
+from chessBitboard import sqToRowCol, promotionShift, enPassantFlag, castleFlag, captureFlag, promotionCodes
+
+# Castling rights are kept as a 4-bit mask
+wks, wqs, bks, bqs = 1, 2, 4, 8
+# castleRightsMask[r][c] - rights that survive a move from or to (r, c)
+castleRightsMask = [[15] * 8 for _ in range(8)]
+castleRightsMask[7][4] = 15 & ~(wks | wqs)
+castleRightsMask[7][7] = 15 & ~wks
+castleRightsMask[7][0] = 15 & ~wqs
+castleRightsMask[0][4] = 15 & ~(bks | bqs)
+castleRightsMask[0][7] = 15 & ~bks
+castleRightsMask[0][0] = 15 & ~bqs
+
+startFen = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+fenToPiece = {'P': 'wp', 'N': 'wN', 'B': 'wB', 'R': 'wR', 'Q': 'wQ', 'K': 'wK',
+              'p': 'bp', 'n': 'bN', 'b': 'bB', 'r': 'bR', 'q': 'bQ', 'k': 'bK'}
+pieceToFen = {v: k for k, v in fenToPiece.items()}
+
+# Orthogonal rays first, then diagonal rays
+rayDirections = ((-1,0),(0,-1),(1,0),(0,1),(-1,-1),(-1,1),(1,-1),(1,1))
+knightOffsets = ((-2,-1),(-2,1),(2,-1),(2,1),(1,2),(1,-2),(-1,2),(-1,-2))
+
 # Base Chess Board
 class GameState():
-    def __init__(self):
+    # backend - "list" scans the 8x8 board, "bitboard" generates moves from chessBitboard attack tables.
+    # debug - recompute the incrementally updated state from scratch after every move and compare.
+    # fen - start from this position instead of the initial one.
+    def __init__(self, backend="list", debug=False, fen=None):
         # Board - 8x8 2D-List and each list has 2 characters.
         # The first character represents color of the piece - 'b','w'.
         # The second character represents type of the piece - 'K','Q','R','B','N','P'.
@@ -23,105 +55,549 @@ class GameState():
         ]
         self.moveFunctions = {'p': self.getPawnMoves, 'R': self.getRookMoves, 'N': self.getKnightMoves,
                             'B': self.getBishopMoves, 'Q': self.getQueenMoves, 'K': self.getKingMoves}
-    
+
         self.whitetoMove = True
         self.moveLog = []
+        self.moveCodeLog = [] # Every move made, as (code, pieceMoved, pieceCaptured) - used by undo
         self.whiteKingLoc = (7,4)
         self.blackKingLoc = (0,4)
         self.checkMate = False
         self.staleMate = False
         self.enPassantPossible = () # Coordinates where En Passant is possible
+        self.enPassantPossibleLog = []
+        self.castleRights = wks | wqs | bks | bqs
+        self.castleRightsLog = []
+        self.halfmoveClock = 0 # Plies since the last capture or pawn move (fifty-move rule)
+        self.halfmoveClockLog = []
+        self.fullmoveNumber = 1
+        self.backend = backend
+        self.bitboards = chessBitboard.BitboardBoard(self.board) if backend == "bitboard" else None
+        self.debug = debug
+        self.zobristKey = chessZobrist.computeHash(self)
+        self.zobristKeyLog = []
+        # Running evaluation (white's point of view) - see chessEval
+        self.mgScore, self.egScore, self.phase = chessEval.computeEval(self)
+        self.evalLog = []
+        if fen is not None:
+            self.loadFen(fen)
+
+    '''
+    Recomputes everything derived from the board, side to move, castling rights and en passant square
+    (king squares, bitboards, Zobrist key, evaluation) and clears the logs.
+    Call after setting up a position by hand.
+    '''
+    def syncState(self):
+        for r in range(8):
+            for c in range(8):
+                if self.board[r][c] == "wK":
+                    self.whiteKingLoc = (r, c)
+                elif self.board[r][c] == "bK":
+                    self.blackKingLoc = (r, c)
+        if self.bitboards is not None:
+            self.bitboards = chessBitboard.BitboardBoard(self.board)
+        self.moveLog = []
+        self.moveCodeLog = []
+        self.enPassantPossibleLog = []
+        self.castleRightsLog = []
+        self.halfmoveClockLog = []
+        self.zobristKey = chessZobrist.computeHash(self)
+        self.zobristKeyLog = []
+        self.mgScore, self.egScore, self.phase = chessEval.computeEval(self)
+        self.evalLog = []
+        self.checkMate = False
+        self.staleMate = False
+
+    '''
+    Sets up the position from a FEN string - board, side to move, castling rights, en passant square
+    and the move counters (which may be left out, as in EPD). Raises ValueError on a malformed FEN.
+    '''
+    def loadFen(self, fen):
+        fields = fen.split()
+        if len(fields) < 4:
+            raise ValueError("FEN needs at least 4 fields: " + fen)
+        ranks = fields[0].split('/')
+        if len(ranks) != 8:
+            raise ValueError("FEN board needs 8 ranks: " + fen)
+        board = []
+        for rank in ranks:
+            row = []
+            for ch in rank:
+                if ch.isdigit():
+                    row.extend(["--"] * int(ch))
+                elif ch in fenToPiece:
+                    row.append(fenToPiece[ch])
+                else:
+                    raise ValueError("Unknown piece '" + ch + "' in FEN: " + fen)
+            if len(row) != 8:
+                raise ValueError("FEN rank '" + rank + "' is not 8 squares: " + fen)
+            board.append(row)
+        for king in ("wK", "bK"):
+            if sum(row.count(king) for row in board) != 1:
+                raise ValueError("FEN needs exactly one " + ("white" if king == "wK" else "black") + " king: " + fen)
+        if any(piece[1] == 'p' for piece in board[0] + board[7]):
+            raise ValueError("FEN has a pawn on the first or last rank: " + fen)
+        if fields[1] not in ('w', 'b'):
+            raise ValueError("FEN side to move must be 'w' or 'b': " + fen)
+        whitetoMove = fields[1] == 'w'
+        castleRights = 0
+        if fields[2] != '-':
+            for ch in fields[2]:
+                if ch not in "KQkq":
+                    raise ValueError("Unknown castling right '" + ch + "' in FEN: " + fen)
+                castleRights |= (wks, wqs, bks, bqs)["KQkq".index(ch)]
+        # A right is only kept while its king and rook are still on their home squares
+        for right, row, rookCol in ((wks, 7, 7), (wqs, 7, 0), (bks, 0, 7), (bqs, 0, 0)):
+            color = 'w' if row == 7 else 'b'
+            if board[row][4] != color + 'K' or board[row][rookCol] != color + 'R':
+                castleRights &= ~right
+        enPassantPossible = ()
+        if fields[3] != '-':
+            if len(fields[3]) != 2 or fields[3][0] not in Move.filesToCols or fields[3][1] not in Move.ranksToRows:
+                raise ValueError("Bad en passant square in FEN: " + fen)
+            row, col = Move.ranksToRows[fields[3][1]], Move.filesToCols[fields[3][0]]
+            # The pawn that just made a double step stands in front of the square it skipped
+            pawnRow, enemyPawn = (row + 1, "bp") if whitetoMove else (row - 1, "wp")
+            if row != (2 if whitetoMove else 5) or board[row][col] != "--" or board[pawnRow][col] != enemyPawn:
+                raise ValueError("En passant square without a pawn that just moved two squares in FEN: " + fen)
+            enPassantPossible = (row, col)
+        # The side that just moved can't have left its king in check
+        opponent = GameState.__new__(GameState)
+        opponent.board, opponent.whitetoMove, opponent.bitboards = board, not whitetoMove, None
+        king = "bK" if whitetoMove else "wK"
+        kingRow = next(r for r in range(8) if king in board[r])
+        if opponent.squareUnderAttack(kingRow, board[kingRow].index(king)):
+            raise ValueError("FEN side not to move is in check: " + fen)
+        try:
+            halfmoveClock = int(fields[4]) if len(fields) > 4 else 0
+            fullmoveNumber = int(fields[5]) if len(fields) > 5 else 1
+        except ValueError:
+            raise ValueError("FEN move counters must be numbers: " + fen)
+
+        self.board = board
+        self.whitetoMove = whitetoMove
+        self.castleRights = castleRights
+        self.enPassantPossible = enPassantPossible
+        self.halfmoveClock = halfmoveClock
+        self.fullmoveNumber = fullmoveNumber
+        self.syncState()
+
+    '''
+    The current position as a FEN string.
+    '''
+    def getFen(self):
+        ranks = []
+        for row in self.board:
+            rank = ""
+            empty = 0
+            for piece in row:
+                if piece == "--":
+                    empty += 1
+                else:
+                    if empty:
+                        rank += str(empty)
+                        empty = 0
+                    rank += pieceToFen[piece]
+            if empty:
+                rank += str(empty)
+            ranks.append(rank)
+        castling = "".join(ch for ch, right in zip("KQkq", (wks, wqs, bks, bqs)) if self.castleRights & right) or "-"
+        if self.enPassantPossible:
+            enPassant = Move.colsToFiles[self.enPassantPossible[1]] + Move.rowsToRanks[self.enPassantPossible[0]]
+        else:
+            enPassant = "-"
+        return " ".join(["/".join(ranks), 'w' if self.whitetoMove else 'b', castling, enPassant,
+                         str(self.halfmoveClock), str(self.fullmoveNumber)])
+
+    '''
+    Independent copy of the game, including the move history (so repetitions are still seen),
+    e.g. for searching on another thread while this one is displayed.
+    '''
+    def copy(self):
+        codes = [entry[0] for entry in self.moveCodeLog]
+        for _ in codes:
+            self.undoMoveCode()
+        gs = GameState(backend=self.backend, fen=self.getFen())
+        for code in codes:
+            self.makeMoveCode(code)
+            gs.makeMoveCode(code)
+        gs.moveLog = list(self.moveLog)
+        return gs
+
     '''
-    Takes input as a move and executes it directly (Doesn't work for en passant, castling or pawn promotion)
+    Takes input as a move and executes it directly (including en passant, castling and pawn promotion)
     '''
     def makeMove(self, move):
-        self.board[move.startRow][move.startCol] = "--"
-        self.board[move.endRow][move.endCol] = move.pieceMoved
         self.moveLog.append(move) # Log Move to show log or undo feature
+        self.makeMoveCode(move.code)
+
+    def undoMove(self):
+        self.moveLog.pop()
+        self.undoMoveCode()
+
+    '''
+    Same as makeMove for a packed move code. Used by search so no Move objects are created;
+    such moves are not added to moveLog and must be taken back with undoMoveCode.
+    '''
+    def makeMoveCode(self, code):
+        board = self.board
+        startRow, startCol = sqToRowCol[code & 63]
+        endRow, endCol = sqToRowCol[(code >> 6) & 63]
+        startSq = code & 63
+        endSq = (code >> 6) & 63
+        pieceMoved = board[startRow][startCol]
+        self.zobristKeyLog.append(self.zobristKey)
+        self.evalLog.append((self.mgScore, self.egScore, self.phase))
+        key = self.zobristKey ^ sideKey ^ pieceKeys[pieceMoved][startSq]
+        mg = self.mgScore - mgTables[pieceMoved][startSq]
+        eg = self.egScore - egTables[pieceMoved][startSq]
+        if code & enPassantFlag:
+            pieceCaptured = board[startRow][endCol]
+            board[startRow][endCol] = "--" # Capturing the Pawn
+            key ^= pieceKeys[pieceCaptured][startRow * 8 + endCol]
+            mg -= mgTables[pieceCaptured][startRow * 8 + endCol]
+            eg -= egTables[pieceCaptured][startRow * 8 + endCol]
+        else:
+            pieceCaptured = board[endRow][endCol]
+            if pieceCaptured != "--":
+                key ^= pieceKeys[pieceCaptured][endSq]
+                mg -= mgTables[pieceCaptured][endSq]
+                eg -= egTables[pieceCaptured][endSq]
+                self.phase -= piecePhase[pieceCaptured]
+        board[startRow][startCol] = "--"
+        board[endRow][endCol] = pieceMoved
+        self.moveCodeLog.append((code, pieceMoved, pieceCaptured))
         self.whitetoMove = not self.whitetoMove
-        if move.pieceMoved == "wK":
-            self.whiteKingLoc = (move.endRow, move.endCol)
-        if move.pieceMoved == "bK":
-            self.blackKingLoc = (move.endRow, move.endCol)
+        if pieceMoved == "wK":
+            self.whiteKingLoc = (endRow, endCol)
+        elif pieceMoved == "bK":
+            self.blackKingLoc = (endRow, endCol)
 
         # Pawn Promotion
-        if move.isPawnPromotion:
-            self.board[move.endRow][move.endCol] = move.pieceMoved[0] + 'Q'
+        if code >> promotionShift & 7:
+            board[endRow][endCol] = pieceMoved[0] + Move.promotionPieces[code >> promotionShift & 7]
+            self.phase += piecePhase[board[endRow][endCol]]
+        pieceLanded = board[endRow][endCol]
+        key ^= pieceKeys[pieceLanded][endSq]
+        mg += mgTables[pieceLanded][endSq]
+        eg += egTables[pieceLanded][endSq]
 
-        # EnPassant Move
-        if move.isEnpassantMove:
-            self.board[move.startRow][move.endCol] = "--" # Capturing the Pawn
+        # Castle Move - the rook jumps over the king
+        if code & castleFlag:
+            rook = pieceMoved[0] + 'R'
+            if endCol - startCol == 2: # King side
+                board[endRow][endCol-1] = board[endRow][endCol+1]
+                board[endRow][endCol+1] = "--"
+                cornerSq, rookSq = endSq + 1, endSq - 1
+            else: # Queen side
+                board[endRow][endCol+1] = board[endRow][endCol-2]
+                board[endRow][endCol-2] = "--"
+                cornerSq, rookSq = endSq - 2, endSq + 1
+            key ^= pieceKeys[rook][cornerSq] ^ pieceKeys[rook][rookSq]
+            mg += mgTables[rook][rookSq] - mgTables[rook][cornerSq]
+            eg += egTables[rook][rookSq] - egTables[rook][cornerSq]
+        self.mgScore = mg
+        self.egScore = eg
 
         # Update EnPassant Possible Variable
-        if move.pieceMoved[1] == "p" and abs(move.startRow - move.endRow) == 2:
-            self.enPassantPossible = ((move.startRow + move.endRow)//2, move.startCol)
+        self.enPassantPossibleLog.append(self.enPassantPossible)
+        if self.enPassantPossible:
+            key ^= enPassantKeys[self.enPassantPossible[1]]
+        if pieceMoved[1] == "p" and abs(startRow - endRow) == 2:
+            self.enPassantPossible = ((startRow + endRow)//2, startCol)
+            key ^= enPassantKeys[startCol]
         else:
             self.enPassantPossible = ()
 
-    def undoMove(self):
-        move = self.moveLog.pop()
-        self.board[move.startRow][move.startCol] = move.pieceMoved
-        self.board[move.endRow][move.endCol] = move.pieceCaptured
+        # Update the move counters
+        self.halfmoveClockLog.append(self.halfmoveClock)
+        if pieceMoved[1] == "p" or pieceCaptured != "--":
+            self.halfmoveClock = 0
+        else:
+            self.halfmoveClock += 1
+        if pieceMoved[0] == 'b':
+            self.fullmoveNumber += 1
+
+        # Update Castling Rights - moving from or capturing on a king/rook home square removes them
+        self.castleRightsLog.append(self.castleRights)
+        key ^= castleKeys[self.castleRights]
+        self.castleRights &= castleRightsMask[startRow][startCol] & castleRightsMask[endRow][endCol]
+        self.zobristKey = key ^ castleKeys[self.castleRights]
+
+        if self.bitboards is not None:
+            self.bitboards.applyMove(code, pieceMoved, pieceCaptured)
+        if self.debug:
+            self.checkIncrementalState()
+
+    def undoMoveCode(self):
+        code, pieceMoved, pieceCaptured = self.moveCodeLog.pop()
+        board = self.board
+        startRow, startCol = sqToRowCol[code & 63]
+        endRow, endCol = sqToRowCol[(code >> 6) & 63]
+        board[startRow][startCol] = pieceMoved
         self.whitetoMove = not self.whitetoMove
-        if move.pieceMoved == "wK":
-            self.whiteKingLoc = (move.startRow, move.startCol)
-        if move.pieceMoved == "bK":
-            self.blackKingLoc = (move.startRow, move.startCol)
+        if pieceMoved == "wK":
+            self.whiteKingLoc = (startRow, startCol)
+        elif pieceMoved == "bK":
+            self.blackKingLoc = (startRow, startCol)
         # Undo EnPassant
-        if move.isEnPassantMove:
-            self.board[move.endRow][move.endCol] = "--"
-            self.board[move.startRow][move.endCol] = move.pieceCaptured
-            self.enPassantPossible = (move.endRow, move.endCol)
-        # Undo 2 Pawn Advance
-        if move.pieceMoved[1] == "p" and abs(move.startRow - move.endRow) == 2:
-            self.enPassantPossible = ()
+        if code & enPassantFlag:
+            board[endRow][endCol] = "--"
+            board[startRow][endCol] = pieceCaptured
+        else:
+            board[endRow][endCol] = pieceCaptured
+        # Undo Castle Move
+        if code & castleFlag:
+            if endCol - startCol == 2: # King side
+                board[endRow][endCol+1] = board[endRow][endCol-1]
+                board[endRow][endCol-1] = "--"
+            else: # Queen side
+                board[endRow][endCol-2] = board[endRow][endCol+1]
+                board[endRow][endCol+1] = "--"
+        self.enPassantPossible = self.enPassantPossibleLog.pop()
+        self.castleRights = self.castleRightsLog.pop()
+        self.halfmoveClock = self.halfmoveClockLog.pop()
+        if pieceMoved[0] == 'b':
+            self.fullmoveNumber -= 1
+        self.zobristKey = self.zobristKeyLog.pop()
+        self.mgScore, self.egScore, self.phase = self.evalLog.pop()
+
+        if self.bitboards is not None:
+            self.bitboards.revertMove(code, pieceMoved, pieceCaptured)
+        if self.debug:
+            self.checkIncrementalState()
+
+    '''
+    64-bit Zobrist key of the current position (pieces, side to move, castling rights, en passant).
+    '''
+    def hash(self):
+        return self.zobristKey
+
+    '''
+    Static evaluation in centipawns from the point of view of the side to move.
+    O(1) - tapers the running middlegame/endgame sums; full=True recomputes them from the board instead.
+    '''
+    def evaluate(self, full=False):
+        if full:
+            score = chessEval.taper(*chessEval.computeEval(self))
+        else:
+            score = chessEval.taper(self.mgScore, self.egScore, self.phase)
+        return score if self.whitetoMove else -score
+
+    '''
+    Debug mode - compares the incrementally updated state with a full recomputation.
+    '''
+    def checkIncrementalState(self):
+        if self.zobristKey != chessZobrist.computeHash(self):
+            raise RuntimeError("Zobrist key out of sync after move log " + str([code for code, _, _ in self.moveCodeLog]))
+        if (self.mgScore, self.egScore, self.phase) != chessEval.computeEval(self):
+            raise RuntimeError("Evaluation out of sync after move log " + str([code for code, _, _ in self.moveCodeLog]))
 
     '''
     All moves considering checks
     '''
     def getValidMoves(self):
-        tempEnPassantPossible = self.enPassantPossible
-        moves = self.getAllPossibleMoves()
-        for i in range(len(moves)-1, -1, -1): # Iterate backwards to prevent bugs
-            self.makeMove(moves[i])
-            self.whitetoMove = not self.whitetoMove
-            if self.inCheck():
-                moves.remove(moves[i])
-                print("Illegal Move")
-            self.whitetoMove = not self.whitetoMove
-            self.undoMove()
+        board = self.board
+        return [Move.fromCode(code, board) for code in self.getValidMoveCodes([])]
+
+    '''
+    All moves considering checks, appended to moves as packed move codes.
+    moves can be a list or an array('I') buffer that the caller reuses.
+    Pins and checks are worked out once from the king's square, so only legal moves are kept
+    without making and unmaking every candidate.
+    '''
+    def getValidMoveCodes(self, moves):
+        if self.whitetoMove:
+            kingRow, kingCol = self.whiteKingLoc
+        else:
+            kingRow, kingCol = self.blackKingLoc
+        if self.bitboards is not None:
+            inCheck = self.bitboards.generateLegalMoves(self, moves)
+        else:
+            inCheck = self.getLegalMoves(kingRow, kingCol, moves)
+        if not inCheck:
+            self.getCastleMoves(kingRow, kingCol, moves)
         if len(moves) == 0:
-            if self.inCheck():
+            if inCheck:
                 self.checkMate = True
             else:
                 self.staleMate = True
         else:
             self.checkMate = False
             self.staleMate = False
-
-        tempEnPassantPossible = self.enPassantPossible
         return moves
-    
+
+    '''
+    Legal moves for the list backend. Returns True if the side to move is in check.
+    '''
+    def getLegalMoves(self, kingRow, kingCol, moves):
+        pins, checks = self.checkForPinsAndChecks(kingRow, kingCol)
+        kingSq = kingRow * 8 + kingCol
+        candidates = []
+        if len(checks) > 1:
+            # Double check - only the king can move
+            self.getKingMoves(kingRow, kingCol, candidates)
+        else:
+            self.getAllPossibleMoves(candidates)
+        validSquares = None
+        if len(checks) == 1:
+            # Block the check or capture the checking piece
+            checkRow, checkCol, dr, dc = checks[0]
+            if self.board[checkRow][checkCol][1] == 'N':
+                validSquares = {checkRow * 8 + checkCol}
+            else:
+                validSquares = set()
+                for i in range(1, 8):
+                    validSquares.add((kingRow + dr * i) * 8 + kingCol + dc * i)
+                    if kingRow + dr * i == checkRow and kingCol + dc * i == checkCol:
+                        break
+
+        king = self.board[kingRow][kingCol]
+        self.board[kingRow][kingCol] = "--" # So the king can't hide behind itself on a checking ray
+        for code in candidates:
+            startSq = code & 63
+            endSq = (code >> 6) & 63
+            if startSq == kingSq:
+                if not self.squareUnderAttack(endSq >> 3, endSq & 7):
+                    moves.append(code)
+            elif code & enPassantFlag:
+                if self.enPassantIsLegal(code, kingRow, kingCol):
+                    moves.append(code)
+            else:
+                pin = pins.get(startSq)
+                if pin is not None and ((endSq >> 3) - (startSq >> 3)) * pin[1] != ((endSq & 7) - (startSq & 7)) * pin[0]:
+                    continue # Pinned piece leaving the pin line
+                if validSquares is not None and endSq not in validSquares:
+                    continue
+                moves.append(code)
+        self.board[kingRow][kingCol] = king
+        return len(checks) > 0
+
+    '''
+    En passant removes two pawns from one rank, which can expose the king along that rank,
+    so it is checked directly on the board. Expects the king square to be empty.
+    '''
+    def enPassantIsLegal(self, code, kingRow, kingCol):
+        startRow, startCol = sqToRowCol[code & 63]
+        endRow, endCol = sqToRowCol[(code >> 6) & 63]
+        pieceMoved = self.board[startRow][startCol]
+        pieceCaptured = self.board[startRow][endCol]
+        self.board[startRow][startCol] = "--"
+        self.board[startRow][endCol] = "--"
+        self.board[endRow][endCol] = pieceMoved
+        legal = not self.squareUnderAttack(kingRow, kingCol)
+        self.board[startRow][startCol] = pieceMoved
+        self.board[startRow][endCol] = pieceCaptured
+        self.board[endRow][endCol] = "--"
+        return legal
+
+    '''
+    Looks outward from the king along every ray and knight jump.
+    Returns pins as {square: (dr, dc)} and checks as a list of (row, col, dr, dc).
+    '''
+    def checkForPinsAndChecks(self, kingRow, kingCol):
+        pins = {}
+        checks = []
+        allyColor = "w" if self.whitetoMove else "b"
+        enemyColor = "b" if self.whitetoMove else "w"
+        # Enemy pawns attack towards our side of the board
+        pawnRow = -1 if self.whitetoMove else 1
+        for j in range(8):
+            d = rayDirections[j]
+            possiblePin = None
+            for i in range(1, 8):
+                endRow = kingRow + d[0] * i
+                endCol = kingCol + d[1] * i
+                if not (0 <= endRow < 8 and 0 <= endCol < 8):
+                    break
+                endPiece = self.board[endRow][endCol]
+                if endPiece == "--":
+                    continue
+                if endPiece[0] == allyColor:
+                    if possiblePin is None:
+                        possiblePin = endRow * 8 + endCol
+                    else: # Second allied piece - no pin or check along this ray
+                        break
+                else:
+                    kind = endPiece[1]
+                    if kind == 'Q' or (j < 4 and kind == 'R') or (j >= 4 and kind == 'B') or \
+                            (i == 1 and kind == 'p' and d[0] == pawnRow and j >= 4):
+                        if possiblePin is None:
+                            checks.append((endRow, endCol, d[0], d[1]))
+                        else:
+                            pins[possiblePin] = d
+                    break
+        for m in knightOffsets:
+            endRow = kingRow + m[0]
+            endCol = kingCol + m[1]
+            if 0 <= endRow < 8 and 0 <= endCol < 8 and self.board[endRow][endCol] == enemyColor + 'N':
+                checks.append((endRow, endCol, m[0], m[1]))
+        return pins, checks
+
+    '''
+    Castling - king and rook unmoved, squares between them empty and the king
+    doesn't pass through or land on an attacked square. Only called when not in check.
+    '''
+    def getCastleMoves(self, r, c, moves):
+        if self.whitetoMove:
+            kingSide, queenSide = self.castleRights & wks, self.castleRights & wqs
+        else:
+            kingSide, queenSide = self.castleRights & bks, self.castleRights & bqs
+        startSq = r * 8 + c
+        if kingSide and self.board[r][c+1] == "--" and self.board[r][c+2] == "--":
+            if not self.squareUnderAttack(r, c+1) and not self.squareUnderAttack(r, c+2):
+                moves.append(startSq | (startSq + 2) << 6 | castleFlag)
+        if queenSide and self.board[r][c-1] == "--" and self.board[r][c-2] == "--" and self.board[r][c-3] == "--":
+            if not self.squareUnderAttack(r, c-1) and not self.squareUnderAttack(r, c-2):
+                moves.append(startSq | (startSq - 2) << 6 | castleFlag)
+
     def inCheck(self):
         if self.whitetoMove:
             return self.squareUnderAttack(self.whiteKingLoc[0],self.whiteKingLoc[1])
         else:
             return self.squareUnderAttack(self.blackKingLoc[0],self.blackKingLoc[1])
 
+    '''
+    True if the opponent of the side to move attacks (r, c).
+    Looks outward from the square along the rays and knight jumps instead of generating the opponent's moves.
+    '''
     def squareUnderAttack(self, r, c):
-        self.whitetoMove = not self.whitetoMove
-        oppMoves = self.getAllPossibleMoves()
-        self.whitetoMove = not self.whitetoMove
-        for move in oppMoves:
-            if move.endRow == r and move.endCol == c:
+        if self.bitboards is not None:
+            return self.bitboards.isSquareAttacked(r * 8 + c, 'b' if self.whitetoMove else 'w')
+        enemyColor = "b" if self.whitetoMove else "w"
+        pawnRow = -1 if self.whitetoMove else 1
+        board = self.board
+        for j in range(8):
+            d = rayDirections[j]
+            for i in range(1, 8):
+                endRow = r + d[0] * i
+                endCol = c + d[1] * i
+                if not (0 <= endRow < 8 and 0 <= endCol < 8):
+                    break
+                endPiece = board[endRow][endCol]
+                if endPiece == "--":
+                    continue
+                if endPiece[0] == enemyColor:
+                    kind = endPiece[1]
+                    if kind == 'Q' or (j < 4 and kind == 'R') or (j >= 4 and kind == 'B') or \
+                            (i == 1 and (kind == 'K' or (kind == 'p' and d[0] == pawnRow and j >= 4))):
+                        return True
+                break
+        for m in knightOffsets:
+            endRow = r + m[0]
+            endCol = c + m[1]
+            if 0 <= endRow < 8 and 0 <= endCol < 8 and board[endRow][endCol] == enemyColor + 'N':
                 return True
         return False
 
     '''
-    All moves without considering checks
+    All moves without considering checks, appended to moves as packed move codes.
     '''
-    def getAllPossibleMoves(self):
-        moves = []
+    def getAllPossibleMoves(self, moves=None):
+        if moves is None:
+            moves = []
+        if self.bitboards is not None:
+            self.bitboards.generateMoves(self, moves)
+            return moves
         for r in range(len(self.board)):
             for c in range(len(self.board)):
                 turn = self.board[r][c][0]
@@ -134,76 +610,60 @@ class GameState():
     Used to get all available PAWN moves.
     '''
     def getPawnMoves(self, r, c, moves):
+        startSq = r * 8 + c
         if self.whitetoMove:
+            endRow, enemyColor, promotes = r - 1, "b", r == 1
             if self.board[r-1][c] == "--":
-                moves.append(Move((r,c), (r-1,c), self.board))
-                if self.board[r-2][c] == "--" and r == 6:
-                    moves.append(Move((r,c), (r-2,c), self.board))
-            if c-1 >= 0:
-                if self.board[r-1][c-1][0] == "b":
-                    moves.append(Move((r,c), (r-1,c-1), self.board))
-                elif (r-1,c-1) == self.enPassantPossible:
-                    moves.append(Move((r,c), (r-1,c-1), self.board, enpassantMove=True))
-            if c+1 <= 7:
-                if self.board[r-1][c+1][0] == "b":
-                    moves.append(Move((r,c), (r-1,c+1), self.board))
-                elif (r-1,c+1) == self.enPassantPossible:
-                    moves.append(Move((r,c), (r-1,c+1), self.board, enpassantMove=True))
-
-        if not self.whitetoMove:
+                addPawnMove(moves, startSq | (startSq - 8) << 6, promotes)
+                if r == 6 and self.board[r-2][c] == "--":
+                    moves.append(startSq | (startSq - 16) << 6)
+        else:
+            endRow, enemyColor, promotes = r + 1, "w", r == 6
             if self.board[r+1][c] == "--":
-                moves.append(Move((r,c), (r+1,c), self.board))
-                if self.board[r+2][c] == "--" and r == 1:
-                    moves.append(Move((r,c), (r+2,c), self.board))
-            if c-1 >= 0:
-                if self.board[r+1][c-1][0] == "w":
-                    moves.append(Move((r,c), (r+1,c-1), self.board))
-                elif (r+1,c-1) == self.enPassantPossible:
-                    moves.append(Move((r,c), (r+1,c-1), self.board, enpassantMove=True))
-            if c+1 <= 7:
-                if self.board[r+1][c+1][0] == "w":
-                    moves.append(Move((r,c), (r+1,c+1), self.board))
-                elif (r+1,c+1) == self.enPassantPossible:
-                    moves.append(Move((r,c), (r+1,c+1), self.board, enpassantMove=True))
+                addPawnMove(moves, startSq | (startSq + 8) << 6, promotes)
+                if r == 1 and self.board[r+2][c] == "--":
+                    moves.append(startSq | (startSq + 16) << 6)
+        for endCol in (c-1, c+1):
+            if 0 <= endCol <= 7:
+                if self.board[endRow][endCol][0] == enemyColor:
+                    addPawnMove(moves, startSq | (endRow * 8 + endCol) << 6 | captureFlag, promotes)
+                elif (endRow,endCol) == self.enPassantPossible:
+                    moves.append(startSq | (endRow * 8 + endCol) << 6 | captureFlag | enPassantFlag)
     '''
     Used to get all ROOK moves.
     '''
     def getRookMoves(self, r, c, moves):
         directions = ((-1,0),(1,0),(0,-1),(0,1))
-        enemyColor = "b" if self.whitetoMove else "w"
-        for d in directions:
-            for i in range(1,8):
-                endRow = r + d[0] * i
-                endCol = c + d[1] * i
-                if 0 <= endRow < 8 and 0 <= endCol < 8:
-                    endPiece = self.board[endRow][endCol]
-                    if endPiece == "--":
-                        moves.append(Move((r,c),(endRow,endCol),self.board))
-                    elif endPiece[0] == enemyColor:
-                        moves.append(Move((r,c),(endRow,endCol),self.board))
-                        break
-                    else:
-                        break
-                else:
-                    break
+        self.getSlidingMoves(r, c, directions, moves)
     '''
     Used to get all KNIGHT moves.
     '''
     def getKnightMoves(self, r, c, moves):
-        knightMoves = ((-2,-1),(-2,1),(2,-1),(2,1),(1,2),(1,-2),(-1,2),(-1,-2))
-        allyColor = "w" if self.whitetoMove else "b"
-        for m in knightMoves:
-            endRow = r + m[0]
-            endCol = c + m[1]
-            if 0 <= endRow < 8 and 0 <= endCol < 8:
-                endPiece = self.board[endRow][endCol]
-                if endPiece[0] != allyColor:
-                    moves.append(Move((r,c),(endRow,endCol),self.board))
+        self.getStepMoves(r, c, knightOffsets, moves)
     '''
     Used to get all BISHOP moves.
     '''
     def getBishopMoves(self, r, c, moves):
         directions = ((-1,-1),(-1,1),(1,-1),(1,1))
+        self.getSlidingMoves(r, c, directions, moves)
+    '''
+    Used to get all QUEEN moves.
+    '''
+    def getQueenMoves(self, r, c, moves):
+        self.getRookMoves(r, c, moves)
+        self.getBishopMoves(r, c, moves)
+    '''
+    Used to get all KING moves.
+    '''
+    def getKingMoves(self, r, c, moves):
+        directions = ((1,1),(1,-1),(1,0),(0,1),(0,-1),(-1,-1),(-1,0),(-1,1))
+        self.getStepMoves(r, c, directions, moves)
+
+    '''
+    Rook, bishop and queen rays - stop at the first piece, capturing it if it is an enemy.
+    '''
+    def getSlidingMoves(self, r, c, directions, moves):
+        startSq = r * 8 + c
         enemyColor = "b" if self.whitetoMove else "w"
         for d in directions:
             for i in range(1,8):
@@ -212,67 +672,139 @@ class GameState():
                 if 0 <= endRow < 8 and 0 <= endCol < 8:
                     endPiece = self.board[endRow][endCol]
                     if endPiece == "--":
-                        moves.append(Move((r,c),(endRow,endCol),self.board))
+                        moves.append(startSq | (endRow * 8 + endCol) << 6)
                     elif endPiece[0] == enemyColor:
-                        moves.append(Move((r,c),(endRow,endCol),self.board))
+                        moves.append(startSq | (endRow * 8 + endCol) << 6 | captureFlag)
                         break
                     else:
                         break
                 else:
                     break
+
     '''
-    Used to get all QUEEN moves.
-    '''
-    def getQueenMoves(self, r, c, moves):
-        self.getRookMoves(r, c, moves)
-        self.getBishopMoves(r, c, moves)
-    '''
-    Used to get all KING moves.
+    Knight and king jumps - any square not holding one of our own pieces.
     '''
-    def getKingMoves(self, r, c, moves):
-        directions = ((1,1),(1,-1),(1,0),(0,1),(0,-1),(-1,-1),(-1,0),(-1,1))
+    def getStepMoves(self, r, c, offsets, moves):
+        startSq = r * 8 + c
         allyColor = "w" if self.whitetoMove else "b"
-        for i in range(8):
-            endRow = r + directions[i][0]
-            endCol = c + directions[i][1]
+        for m in offsets:
+            endRow = r + m[0]
+            endCol = c + m[1]
             if 0 <= endRow < 8 and 0 <= endCol < 8:
                 endPiece = self.board[endRow][endCol]
-                if endPiece[0] != allyColor:
-                    moves.append(Move((r,c),(endRow,endCol),self.board))
+                if endPiece == "--":
+                    moves.append(startSq | (endRow * 8 + endCol) << 6)
+                elif endPiece[0] != allyColor:
+                    moves.append(startSq | (endRow * 8 + endCol) << 6 | captureFlag)
 
 
+'''
+Appends a pawn move, or one move per promotion piece if it reaches the last rank.
+'''
+def addPawnMove(moves, code, promotes):
+    if promotes:
+        for promotion in promotionCodes:
+            moves.append(code | promotion)
+    else:
+        moves.append(code)
+
+
+'''
+One reusable array('I') move list per ply, so search and perft don't build a new list at every node.
+Clear a buffer with del buffer[:] before passing it to getValidMoveCodes.
+'''
+def moveBuffers(maxPly):
+    return [array('I') for _ in range(maxPly)]
+
+
+'''
+A move is packed into one int (see chessBitboard for the layout):
+start square, end square, promotion piece and en passant / castle / capture flags.
+Rows, columns and the other details are decoded from it on demand.
+'''
 class Move():
+    __slots__ = ('code', 'pieceMoved', 'pieceCaptured')
+
     # Assigning dictionaries for ranks and files to index values
     ranksToRows = {"1": 7, "2": 6, "3": 5, "4": 4,
                     "5": 3, "6": 2, "7": 1, "8": 0}
     rowsToRanks = {v: k for k, v in ranksToRows.items()}
-    
+
     filesToCols = {"a": 0, "b": 1, "c": 2, "d": 3,
                     "e": 4, "f": 5, "g": 6, "h": 7}
     colsToFiles = {v: k for k, v in filesToCols.items()}
 
-    def __init__(self, startSq, endSq, board, enpassantMove = False):
-        # Setting values for ease of use
-        self.startRow = startSq[0]
-        self.startCol = startSq[1]
-        self.endRow = endSq[0]
-        self.endCol = endSq[1]
-        self.pieceMoved = board[self.startRow][self.startCol]
-        self.pieceCaptured = board[self.endRow][self.endCol]
+    # Index = promotion field of the move code
+    promotionPieces = ('', 'N', 'B', 'R', 'Q')
+
+    def __init__(self, startSq, endSq, board, enpassantMove = False, isCastleMove = False, promotionPiece = 'Q'):
+        self.pieceMoved = board[startSq[0]][startSq[1]]
+        self.pieceCaptured = board[endSq[0]][endSq[1]]
+        code = startSq[0] * 8 + startSq[1] | (endSq[0] * 8 + endSq[1]) << 6
+        if (self.pieceMoved == "wp" and endSq[0] == 0) or (self.pieceMoved == "bp" and endSq[0] == 7):
+            code |= self.promotionPieces.index(promotionPiece) << promotionShift
+        if enpassantMove:
+            code |= enPassantFlag | captureFlag
+            self.pieceCaptured = "wp" if self.pieceMoved == "bp" else "bp"
+        elif self.pieceCaptured != "--":
+            code |= captureFlag
+        if isCastleMove:
+            code |= castleFlag
+        self.code = code
+
+    '''
+    Builds a Move from a packed code, reading the pieces off the board it was generated for.
+    '''
+    @classmethod
+    def fromCode(cls, code, board):
+        move = cls.__new__(cls)
+        move.code = code
+        startRow, startCol = sqToRowCol[code & 63]
+        endRow, endCol = sqToRowCol[(code >> 6) & 63]
+        move.pieceMoved = board[startRow][startCol]
+        move.pieceCaptured = board[startRow][endCol] if code & enPassantFlag else board[endRow][endCol]
+        return move
+
+    @property
+    def startRow(self):
+        return (self.code & 63) >> 3
+
+    @property
+    def startCol(self):
+        return self.code & 7
+
+    @property
+    def endRow(self):
+        return (self.code >> 9) & 7
+
+    @property
+    def endCol(self):
+        return (self.code >> 6) & 7
+
+    # Squares and promotion piece - the flags follow from the position, so they are not part of the identity
+    @property
+    def moveID(self):
+        return self.code & ((1 << 15) - 1)
 
-        self.isPawnPromotion = (self.pieceMoved == "wp" and self.endRow == 0) or (self.pieceMoved == "bp" and self.endRow == 7)
+    @property
+    def isPawnPromotion(self):
+        return (self.code >> promotionShift & 7) != 0
 
-        self.isEnPassantMove = enpassantMove
+    @property
+    def promotionPiece(self):
+        return self.promotionPieces[self.code >> promotionShift & 7]
 
-        self.moveID = self.startRow * 1000 + self.startCol * 100 + self.endRow * 10 + self.endCol
-        print(self.moveID)
+    @property
+    def isEnpassantMove(self):
+        return (self.code & enPassantFlag) != 0
 
-        self.isEnpassantMove = enpassantMove
-        if self.isEnpassantMove:
-             if self.pieceMoved == "bp":
-                    self.pieceCaptured = "wp"
-             else:
-                    self.pieceCaptured = "bp"
+    @property
+    def isCastleMove(self):
+        return (self.code & castleFlag) != 0
+
+    @property
+    def isCapture(self):
+        return (self.code & captureFlag) != 0
 
     '''
     Overriding the equals method
@@ -282,9 +814,19 @@ class Move():
             return self.moveID == other.moveID
         return False
 
+    def __hash__(self):
+        return self.moveID
+
     def getChessNotation(self, gs):
         piece = gs.board[self.endRow][self.endCol]
         return piece + ": " + self.getRankFile(self.startRow, self.startCol) + " -> " + self.getRankFile(self.endRow, self.endCol)
 
     def getRankFile(self, r, c):
-        return self.rowsToRanks[r] + self.colsToFiles[c]
\ No newline at end of file
+        return self.rowsToRanks[r] + self.colsToFiles[c]
+
+    '''
+    Long algebraic notation as used by UCI, e.g. e2e4 or e7e8q.
+    '''
+    def getUciNotation(self):
+        return self.colsToFiles[self.startCol] + self.rowsToRanks[self.startRow] + \
+            self.colsToFiles[self.endCol] + self.rowsToRanks[self.endRow] + self.promotionPiece.lower()
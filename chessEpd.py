@@ -0,0 +1,93 @@
+"""
+Streaming reader for EPD and FEN files.
+Positions are yielded one line at a time, so files of any size are read in constant memory.
+Lines may be plain FEN (6 fields) or EPD (4 fields followed by operations such as bm e4; id "test 1";).
+Blank lines and lines starting with # are skipped; files ending in .gz are decompressed on the fly.
+"""
+
+import gzip
+
+import chessEngine
+
+'''
+Splits one EPD/FEN line into (fen, operations). operations maps opcode -> list of operand strings.
+EPD hmvc/fmvn operations become the FEN move counters.
+'''
+def parseLine(line):
+    fields = line.split(None, 4)
+    if len(fields) < 4:
+        raise ValueError("EPD/FEN line needs at least 4 fields: " + line)
+    rest = fields[4] if len(fields) > 4 else ""
+    counters = rest.split()
+    if len(counters) >= 2 and counters[0].isdigit() and counters[1].isdigit():
+        # Plain FEN - the move counters follow the en passant field
+        operations = parseOperations(rest.split(None, 2)[2] if len(counters) > 2 else "")
+        return " ".join(fields[:4] + counters[:2]), operations
+    operations = parseOperations(rest)
+    halfmoveClock = operations.get("hmvc", ["0"])[0]
+    fullmoveNumber = operations.get("fmvn", ["1"])[0]
+    return " ".join(fields[:4] + [halfmoveClock, fullmoveNumber]), operations
+
+'''
+Parses 'bm Nf3 e4; id "pos 1";' into {'bm': ['Nf3', 'e4'], 'id': ['pos 1']}.
+Semicolons inside double quotes don't end an operation.
+'''
+def parseOperations(text):
+    operations = {}
+    tokens = []
+    token = ""
+    inQuotes = False
+    quoted = False
+    for ch in text + ";":
+        if inQuotes:
+            if ch == '"':
+                inQuotes = False
+            else:
+                token += ch
+        elif ch == '"':
+            inQuotes = True
+            quoted = True
+        elif ch in " \t;":
+            if token or quoted:
+                tokens.append(token)
+            token = ""
+            quoted = False
+            if ch == ";" and tokens:
+                operations[tokens[0]] = tokens[1:]
+                tokens = []
+        else:
+            token += ch
+    return operations
+
+'''
+Yields (fen, operations) for every position in the file, reading it lazily line by line.
+A line that can't be parsed raises ValueError, or with errors=True is yielded as (line, the ValueError)
+so one bad line doesn't end the whole file.
+'''
+def readPositions(path, errors=False):
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt") as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                try:
+                    position = parseLine(line)
+                except ValueError as e:
+                    if not errors:
+                        raise
+                    position = (line, e)
+                yield position
+
+'''
+Yields (GameState, operations) for every position in the file.
+With reuse=True the same GameState is loaded with each position in turn instead of creating a new one,
+so only use a yielded state until asking for the next.
+'''
+def loadPositions(path, backend="list", reuse=False):
+    gs = None
+    for fen, operations in readPositions(path):
+        if gs is None or not reuse:
+            gs = chessEngine.GameState(backend=backend, fen=fen)
+        else:
+            gs.loadFen(fen)
+        yield gs, operations
@@ -0,0 +1,121 @@
+"""
+Evaluation tables - material plus middlegame and endgame piece-square tables.
+The score is tapered between the two by the game phase (remaining knights, bishops, rooks and queens).
+GameState keeps the running sums up to date in makeMove/undoMove; computeEval recomputes them from scratch.
+"""
+
+from chessBitboard import pieceNames
+
+mgValues = {'p': 82, 'N': 337, 'B': 365, 'R': 477, 'Q': 1025, 'K': 0}
+egValues = {'p': 94, 'N': 281, 'B': 297, 'R': 512, 'Q': 936, 'K': 0}
+phaseWeights = {'p': 0, 'N': 1, 'B': 1, 'R': 2, 'Q': 4, 'K': 0}
+totalPhase = 24 # Phase of the starting position - pure middlegame
+
+# Tables are from white's point of view with rank 8 on the first line, so they index like GameState.board.
+mgSquares = {
+    'p': [  0,   0,   0,   0,   0,   0,   0,   0,
+           50,  50,  50,  50,  50,  50,  50,  50,
+           10,  10,  20,  30,  30,  20,  10,  10,
+            5,   5,  10,  25,  25,  10,   5,   5,
+            0,   0,   0,  20,  20,   0,   0,   0,
+            5,  -5, -10,   0,   0, -10,  -5,   5,
+            5,  10,  10, -20, -20,  10,  10,   5,
+            0,   0,   0,   0,   0,   0,   0,   0],
+    'N': [-50, -40, -30, -30, -30, -30, -40, -50,
+          -40, -20,   0,   0,   0,   0, -20, -40,
+          -30,   0,  10,  15,  15,  10,   0, -30,
+          -30,   5,  15,  20,  20,  15,   5, -30,
+          -30,   0,  15,  20,  20,  15,   0, -30,
+          -30,   5,  10,  15,  15,  10,   5, -30,
+          -40, -20,   0,   5,   5,   0, -20, -40,
+          -50, -40, -30, -30, -30, -30, -40, -50],
+    'B': [-20, -10, -10, -10, -10, -10, -10, -20,
+          -10,   0,   0,   0,   0,   0,   0, -10,
+          -10,   0,   5,  10,  10,   5,   0, -10,
+          -10,   5,   5,  10,  10,   5,   5, -10,
+          -10,   0,  10,  10,  10,  10,   0, -10,
+          -10,  10,  10,  10,  10,  10,  10, -10,
+          -10,   5,   0,   0,   0,   0,   5, -10,
+          -20, -10, -10, -10, -10, -10, -10, -20],
+    'R': [  0,   0,   0,   0,   0,   0,   0,   0,
+            5,  10,  10,  10,  10,  10,  10,   5,
+           -5,   0,   0,   0,   0,   0,   0,  -5,
+           -5,   0,   0,   0,   0,   0,   0,  -5,
+           -5,   0,   0,   0,   0,   0,   0,  -5,
+           -5,   0,   0,   0,   0,   0,   0,  -5,
+           -5,   0,   0,   0,   0,   0,   0,  -5,
+            0,   0,   0,   5,   5,   0,   0,   0],
+    'Q': [-20, -10, -10,  -5,  -5, -10, -10, -20,
+          -10,   0,   0,   0,   0,   0,   0, -10,
+          -10,   0,   5,   5,   5,   5,   0, -10,
+           -5,   0,   5,   5,   5,   5,   0,  -5,
+            0,   0,   5,   5,   5,   5,   0,  -5,
+          -10,   5,   5,   5,   5,   5,   0, -10,
+          -10,   0,   5,   0,   0,   0,   0, -10,
+          -20, -10, -10,  -5,  -5, -10, -10, -20],
+    'K': [-30, -40, -40, -50, -50, -40, -40, -30,
+          -30, -40, -40, -50, -50, -40, -40, -30,
+          -30, -40, -40, -50, -50, -40, -40, -30,
+          -30, -40, -40, -50, -50, -40, -40, -30,
+          -20, -30, -30, -40, -40, -30, -30, -20,
+          -10, -20, -20, -20, -20, -20, -20, -10,
+           20,  20,   0,   0,   0,   0,  20,  20,
+           20,  30,  10,   0,   0,  10,  30,  20],
+}
+egSquares = dict(mgSquares)
+egSquares['p'] = [  0,   0,   0,   0,   0,   0,   0,   0,
+                   80,  80,  80,  80,  80,  80,  80,  80,
+                   50,  50,  50,  50,  50,  50,  50,  50,
+                   30,  30,  30,  30,  30,  30,  30,  30,
+                   15,  15,  15,  15,  15,  15,  15,  15,
+                    5,   5,   5,   5,   5,   5,   5,   5,
+                    0,   0,   0,   0,   0,   0,   0,   0,
+                    0,   0,   0,   0,   0,   0,   0,   0]
+egSquares['K'] = [-50, -40, -30, -20, -20, -30, -40, -50,
+                  -30, -20, -10,   0,   0, -10, -20, -30,
+                  -30, -10,  20,  30,  30,  20, -10, -30,
+                  -30, -10,  30,  40,  40,  30, -10, -30,
+                  -30, -10,  30,  40,  40,  30, -10, -30,
+                  -30, -10,  20,  30,  30,  20, -10, -30,
+                  -30, -30,   0,   0,   0,   0, -30, -30,
+                  -50, -30, -30, -30, -30, -30, -30, -50]
+
+'''
+Material plus square bonus for every piece on every square, signed so white is positive.
+Black reads the white table upside down (sq ^ 56 flips the rank).
+'''
+def buildTables(values, squares):
+    tables = {}
+    for piece in pieceNames:
+        kind = piece[1]
+        if piece[0] == 'w':
+            tables[piece] = [values[kind] + squares[kind][sq] for sq in range(64)]
+        else:
+            tables[piece] = [-(values[kind] + squares[kind][sq ^ 56]) for sq in range(64)]
+    return tables
+
+mgTables = buildTables(mgValues, mgSquares)
+egTables = buildTables(egValues, egSquares)
+piecePhase = {piece: phaseWeights[piece[1]] for piece in pieceNames}
+
+'''
+Full recomputation from the board - returns (middlegame score, endgame score, phase).
+'''
+def computeEval(gs):
+    mg = eg = phase = 0
+    for r in range(8):
+        for c in range(8):
+            piece = gs.board[r][c]
+            if piece != "--":
+                mg += mgTables[piece][r * 8 + c]
+                eg += egTables[piece][r * 8 + c]
+                phase += piecePhase[piece]
+    return mg, eg, phase
+
+'''
+Blends the middlegame and endgame scores - white's point of view.
+'''
+def taper(mg, eg, phase):
+    if phase > totalPhase:
+        phase = totalPhase # Early promotions can push the phase past the start position
+    return (mg * phase + eg * (totalPhase - phase)) // totalPhase
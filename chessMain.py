@@ -2,8 +2,12 @@
 Main file for handling user input and displaying current GameState
 '''
 
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 import pygame as p
 import chessEngine
+import chessSearch
 
 p.init()
 width = height = 512
@@ -11,6 +15,9 @@ dimension = 8
 sq_size = height // dimension
 max_fps = 15
 images = {}
+playerOne = True # True if a human plays white, False to let the engine play it.
+playerTwo = True # Same for black.
+aiTimeMs = 2000 # Thinking time per engine move.
 
 '''
 Initialize global dictionary of images.
@@ -23,6 +30,19 @@ def loadImages():
     # We can access an image by saying 'images['wp']
     # pieces = IMAGES['wp'] = p.image.load("images/wp.png")  --> Not Efficient, but Possible.
 
+'''
+Engine work for one turn - runs on the background thread with its own copy of the game,
+so the board being drawn is never touched. Returns the legal move codes, the checkmate and
+stalemate flags and, if think is True, the engine's move (0 when there is none).
+'''
+def engineTurn(gs, search, think):
+    codes = gs.getValidMoveCodes([])
+    checkMate, staleMate = gs.checkMate, gs.staleMate
+    bestMove = 0
+    if think and codes:
+        bestMove = search.iterativeDeepening(gs, aiTimeMs)[0]
+    return codes, checkMate, staleMate, bestMove
+
 '''
 The main driver for our code. This will handle user input and updating graphics.
 '''
@@ -33,19 +53,30 @@ def main():
     clock = p.time.Clock()
     screen.fill(p.Color("black"))
     gs = chessEngine.GameState()
-    validMoves = gs.getValidMoves()
-    moveMade = False # Flag variable for when a move is made.
+    engine = ThreadPoolExecutor(max_workers=1) # Move generation and search, off the event loop
+    search = chessSearch.Search()
+    stopEvent = threading.Event() # Unlike Search.stop(), a stop that arrives before the search starts is not lost
+    search.stopEvent = stopEvent
+    validMoves = [] # Filled in when the engine job for the current position finishes.
+    job = None
+    moveMade = True # Flag variable for when a move is made - starts the first engine job.
     print(gs.board)
     loadImages() # ONLY DO THIS ONCE!
+    boardSurface = p.Surface((width, height))
+    drawBoard(boardSurface) # The squares never change, so they are drawn once and copied from here.
+    shown = [[None] * dimension for _ in range(dimension)] # What each square showed on the last frame.
     running = True
     sqSelected = () # Keeps track of last click of the user.
     playerClicks = [] # Keeps track of player clicks.
     while running:
+        humanTurn = isHumanTurn(gs)
         for e in p.event.get():
             if e.type == p.QUIT:
                 running = False
+            elif e.type == p.WINDOWEXPOSED:
+                shown = [[None] * dimension for _ in range(dimension)] # Window was covered - repaint everything.
             # MOUSE HANDLER
-            elif e.type == p.MOUSEBUTTONDOWN:
+            elif e.type == p.MOUSEBUTTONDOWN and humanTurn:
                 location = p.mouse.get_pos() # x,y location of mouse.
                 col = location[0] // sq_size
                 row = location[1] // sq_size
@@ -63,6 +94,7 @@ def main():
                             moveMade = True
                             sqSelected = ()
                             playerClicks = []
+                            break
                     if not moveMade:
                         playerClicks = [sqSelected]
             #KEY HANDLER
@@ -74,36 +106,62 @@ def main():
                     else:
                         pass
         if moveMade:
-            validMoves = gs.getValidMoves()
+            if job is not None:
+                stopEvent.set() # The position it was working on is gone.
+                if not job.cancel():
+                    job.exception() # Wait until it has seen the stop - clearing the Event sooner could lose it
+            stopEvent.clear()
+            validMoves = []
+            job = engine.submit(engineTurn, gs.copy(), search, not isHumanTurn(gs))
             moveMade = False
-        drawGameState(screen, gs)
+        elif job is not None and job.done():
+            codes, gs.checkMate, gs.staleMate, bestMove = job.result()
+            job = None
+            validMoves = [chessEngine.Move.fromCode(code, gs.board) for code in codes]
+            if bestMove:
+                gs.makeMove(chessEngine.Move.fromCode(bestMove, gs.board))
+                moveMade = True
+        drawGameState(screen, gs, boardSurface, shown)
         clock.tick(max_fps)
-        p.display.flip()
+    stopEvent.set()
+    engine.shutdown(wait=True, cancel_futures=True)
+
+def isHumanTurn(gs):
+    return (gs.whitetoMove and playerOne) or (not gs.whitetoMove and playerTwo)
 
 '''
 Responsible for all graphics within the current game state.
+Only squares whose piece changed since the last frame are repainted and sent to the display,
+so an idle board costs a comparison of 64 strings per frame.
 '''
-def drawGameState(screen,gs):
-    drawBoard(screen, gs.board) # Draws the square on the board.
-    drawPieces(screen, gs.board) # Draws pieces on top of the squares
+def drawGameState(screen, gs, boardSurface, shown):
+    dirty = []
+    for r in range(dimension):
+        for c in range(dimension):
+            piece = gs.board[r][c]
+            if shown[r][c] != piece:
+                shown[r][c] = piece
+                dirty.append(drawSquare(screen, boardSurface, r, c, piece))
+    if dirty:
+        p.display.update(dirty)
 
 # Draws squares on the board.
-def drawBoard(screen, board):
+def drawBoard(surface):
     colors = [p.Color("white"),p.Color("gray")]
     for r in range(dimension):
         for c in range(dimension):
             color = colors[((r+c)%2)]
-            p.draw.rect(screen, color, p.Rect(c*sq_size,r*sq_size,sq_size,sq_size))
+            p.draw.rect(surface, color, p.Rect(c*sq_size,r*sq_size,sq_size,sq_size))
 
 
-#Draws pieces on the board.
-def drawPieces(screen, board):
-    for r in range(dimension):
-        for c in range(dimension):
-            piece = board[r][c]
-            if piece != "--":
-                screen.blit(images[piece], p.Rect(c*sq_size,r*sq_size,sq_size,sq_size))
+# Repaints one square from the cached board and draws its piece on top. Returns the square's rect.
+def drawSquare(screen, boardSurface, r, c, piece):
+    rect = p.Rect(c*sq_size,r*sq_size,sq_size,sq_size)
+    screen.blit(boardSurface, rect, rect)
+    if piece != "--":
+        screen.blit(images[piece], rect)
+    return rect
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
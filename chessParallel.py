@@ -0,0 +1,240 @@
+"""
+Lazy SMP - several processes search the same position at once and share one transposition table.
+The table lives in a multiprocessing.shared_memory block, so whatever one process finds is
+picked up by the others through the table alone; no other communication happens during a search.
+
+Usage: python chessParallel.py [FEN] [--workers N] [--time-ms MS | --depth N] [--backend list|bitboard]
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import Event, shared_memory
+
+import chessEngine
+import chessSearch
+from chessSearch import TranspositionTable
+
+# Packed entry data - move (18 bits) | score + scoreOffset (20 bits) | depth (7) | flag (2) | generation (8)
+scoreShift, depthShift, flagShift, generationShift = 18, 38, 45, 47
+scoreOffset = 1 << 19
+headerWords = 2 # Word 0 holds the search generation; entries start after the header
+
+
+class SharedTranspositionTable():
+    exact, lowerBound, upperBound = TranspositionTable.exact, TranspositionTable.lowerBound, TranspositionTable.upperBound
+
+    '''
+    Same probe/store interface as chessSearch.TranspositionTable, backed by a flat array of
+    two 64-bit words per slot: (key ^ data, data). There are no locks - a slot written by two
+    processes at once (or read halfway through a write) fails the XOR check and reads as a miss.
+    With name=None a new block is created; otherwise the named block is attached to.
+    '''
+    def __init__(self, size=1 << 20, name=None):
+        self.owner = name is None
+        if self.owner:
+            self.size = 1 << (size.bit_length() - 1)
+            self.memory = shared_memory.SharedMemory(create=True, size=(headerWords + 2 * self.size) * 8)
+        else:
+            self.memory = shared_memory.SharedMemory(name=name)
+            self.size = (self.memory.size // 8 - headerWords) // 2
+        self.name = self.memory.name
+        self.mask = self.size - 1
+        self.words = self.memory.buf.cast('Q')
+        self.generation = self.words[0]
+
+    '''
+    The owner starts a new generation; attached tables just pick up the owner's current one,
+    so every process of one search stores the same generation.
+    '''
+    def newSearch(self):
+        if self.owner:
+            self.words[0] = (self.words[0] + 1) & 255
+        self.generation = self.words[0]
+
+    def probe(self, key):
+        i = headerWords + 2 * (key & self.mask)
+        words = self.words
+        data = words[i + 1]
+        if data == 0 or words[i] ^ data != key:
+            return None
+        return (data >> depthShift & 127, (data >> scoreShift & 0xFFFFF) - scoreOffset,
+                data >> flagShift & 3, data & 0x3FFFF, data >> generationShift)
+
+    '''
+    Replace-by-depth, as in chessSearch.TranspositionTable.
+    '''
+    def store(self, key, depth, score, flag, move):
+        i = headerWords + 2 * (key & self.mask)
+        words = self.words
+        old = words[i + 1]
+        if old == 0 or words[i] ^ old == key or depth >= (old >> depthShift & 127) or \
+                old >> generationShift != self.generation:
+            data = move | (score + scoreOffset) << scoreShift | min(depth, 127) << depthShift | \
+                flag << flagShift | self.generation << generationShift
+            words[i] = key ^ data
+            words[i + 1] = data
+
+    def clear(self):
+        self.memory.buf[headerWords * 8:] = bytes(len(self.memory.buf) - headerWords * 8)
+
+    '''
+    Detaches this process from the block; the owner also frees it.
+    '''
+    def close(self):
+        self.words.release()
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+
+# Per-process state of a helper, created once by initHelper and kept warm across searches
+helperSearch = None
+helperBackend = "list"
+
+'''
+Runs once in every helper process - attaches to the shared table and builds the attack tables
+and a Search that every later search on this process reuses.
+'''
+def initHelper(tableName, stopEvent, backend):
+    global helperSearch, helperBackend
+    helperBackend = backend
+    chessEngine.GameState(backend=backend)
+    helperSearch = chessSearch.Search(SharedTranspositionTable(name=tableName))
+    helperSearch.stopEvent = stopEvent
+
+'''
+Searches the position given as (fen, move codes played from it) until the time runs out or the
+main process sets the stop event. Returns (best move code, score, completed depth, nodes).
+'''
+def helperSearchPosition(fen, codes, timeMs, maxDepth, startDepth):
+    gs = chessEngine.GameState(backend=helperBackend, fen=fen)
+    for code in codes:
+        gs.makeMoveCode(code)
+    code, score, info = helperSearch.iterativeDeepening(gs, timeMs, maxDepth, None, startDepth)
+    return code, score, info['depth'], helperSearch.nodes
+
+
+'''
+The position as (fen, move codes) - the FEN of the first logged position plus the moves played
+since, so helpers see the same game history and can detect repetitions.
+'''
+def rootPosition(gs):
+    codes = [entry[0] for entry in gs.moveCodeLog]
+    for _ in codes:
+        gs.undoMoveCode()
+    fen = gs.getFen()
+    for code in codes:
+        gs.makeMoveCode(code)
+    return fen, codes
+
+
+class ParallelSearch():
+    '''
+    workers is the total number of searching processes, including this one.
+    The helper processes and the shared table are created once and reused by every search;
+    call close() (or use a with block) to shut them down.
+    '''
+    def __init__(self, workers=None, ttSize=1 << 20, backend="list"):
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.table = SharedTranspositionTable(ttSize)
+        self.stopEvent = Event()
+        self.search = chessSearch.Search(SharedTranspositionTable(name=self.table.name))
+        self.search.stopEvent = self.stopEvent
+        self.executor = None
+        if self.workers > 1:
+            self.executor = ProcessPoolExecutor(max_workers=self.workers - 1, initializer=initHelper,
+                                                initargs=(self.table.name, self.stopEvent, backend))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    '''
+    Asks a running search (this process and every helper) to finish.
+    '''
+    def stop(self):
+        self.stopEvent.set()
+
+    '''
+    Same arguments and result as Search.iterativeDeepening. This process searches the position as
+    usual while the helpers search it too, half of them starting one depth deeper, so the processes
+    drift apart and fill the shared table with different parts of the tree.
+    The move is taken from this process unless a helper completed a deeper iteration;
+    info['nodes'] and info['nps'] count the nodes of every process.
+    '''
+    def iterativeDeepening(self, gs, timeMs=None, maxDepth=chessSearch.maxPly, report=None):
+        startTime = time.perf_counter()
+        self.stopEvent.clear()
+        self.table.newSearch()
+        futures = []
+        if self.executor is not None:
+            fen, codes = rootPosition(gs)
+            for helper in range(self.workers - 1):
+                futures.append(self.executor.submit(helperSearchPosition, fen, codes, timeMs, maxDepth, 1 + helper % 2))
+        try:
+            code, score, info = self.search.iterativeDeepening(gs, timeMs, maxDepth, report)
+        finally:
+            self.stopEvent.set()
+        nodes = self.search.nodes
+        for future in futures:
+            helperCode, helperScore, helperDepth, helperNodes = future.result()
+            nodes += helperNodes
+            if helperCode and helperDepth > info['depth']:
+                code, score = helperCode, helperScore
+                info = dict(info, depth=helperDepth, score=helperScore,
+                            pv=self.search.principalVariation(gs, helperDepth))
+        elapsed = time.perf_counter() - startTime
+        info = dict(info, nodes=nodes, nps=int(nodes / elapsed) if elapsed > 0 else 0, timeMs=int(elapsed * 1000))
+        return code, score, info
+
+    '''
+    Best move within timeMs milliseconds as a Move, like chessSearch.findBestMove.
+    '''
+    def findBestMove(self, gs, timeMs, maxDepth=chessSearch.maxPly, report=None):
+        code, score, info = self.iterativeDeepening(gs, timeMs, maxDepth, report)
+        if not code:
+            return None
+        return chessEngine.Move.fromCode(code, gs.board)
+
+    def close(self):
+        if self.executor is not None:
+            self.stopEvent.set()
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
+        self.search.tt.close()
+        self.table.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Search one position on several processes")
+    parser.add_argument("fen", nargs="?", default=chessEngine.startFen)
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="searching processes (default: all cores)")
+    limit = parser.add_mutually_exclusive_group()
+    limit.add_argument("--time-ms", type=int, help="search for this many milliseconds")
+    limit.add_argument("--depth", type=int, help="search to this depth")
+    parser.add_argument("--backend", choices=["list", "bitboard"], default="bitboard")
+    args = parser.parse_args(argv)
+    timeMs = args.time_ms if args.time_ms or args.depth else 5000
+
+    gs = chessEngine.GameState(backend=args.backend, fen=args.fen)
+    with ParallelSearch(args.workers, backend=args.backend) as search:
+        report = lambda info: print("depth %d score %d nodes %d nps %d time %dms pv %s" % (
+            info['depth'], info['score'], info['nodes'], info['nps'], info['timeMs'],
+            " ".join(chessSearch.pvToUci(gs, info['pv']))))
+        code, score, info = search.iterativeDeepening(gs, timeMs, args.depth or chessSearch.maxPly, report)
+    if not code:
+        print("No legal moves")
+        return 0
+    print("bestmove %s score %d depth %d nodes %d nps %d with %d workers" % (
+        chessEngine.Move.fromCode(code, gs.board).getUciNotation(), score, info['depth'],
+        info['nodes'], info['nps'], args.workers))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,173 @@
+"""
+Perft - counts the leaf nodes of the legal move tree to a fixed depth.
+Checks move generation against known node counts and measures its speed.
+
+Usage: python chessPerft.py [--depth N] [--backend list|bitboard|both] [--positions NAME ...]
+                            [--json FILE] [--stats FILE] [--divide FEN DEPTH]
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import chessEngine
+import chessProfile
+
+try:
+    import resource # Not available on Windows
+except ImportError:
+    resource = None
+
+# Name, FEN and known node counts by depth (from the Chess Programming Wiki)
+referencePositions = [
+    ("start", "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+        [20, 400, 8902, 197281, 4865609, 119060324]),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+        [48, 2039, 97862, 4085603, 193690690]),
+    ("position3", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+        [14, 191, 2812, 43238, 674624, 11030083]),
+    ("position4", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+        [6, 264, 9467, 422333, 15833292]),
+    ("position5", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+        [44, 1486, 62379, 2103487, 89941194]),
+    ("position6", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+        [46, 2079, 89890, 3894594, 164075551]),
+]
+
+
+'''
+Number of leaf nodes depth plies below the current position.
+Moves are made and taken back as codes, with one reusable buffer per ply.
+'''
+def perft(gs, depth, buffers=None, ply=0):
+    if buffers is None:
+        buffers = chessEngine.moveBuffers(depth + 1)
+    moves = buffers[ply]
+    del moves[:]
+    gs.getValidMoveCodes(moves)
+    if depth <= 1:
+        return len(moves) if depth == 1 else 1
+    nodes = 0
+    for code in moves:
+        gs.makeMoveCode(code)
+        nodes += perft(gs, depth - 1, buffers, ply + 1)
+        gs.undoMoveCode()
+    return nodes
+
+'''
+Perft split by root move - {uci move: nodes}. Comparing against another engine's divide
+output narrows a wrong node count down to the move that causes it.
+'''
+def divide(gs, depth):
+    result = {}
+    buffers = chessEngine.moveBuffers(depth + 1)
+    for move in gs.getValidMoves():
+        gs.makeMoveCode(move.code)
+        result[move.getUciNotation()] = perft(gs, depth - 1, buffers, 1)
+        gs.undoMoveCode()
+    return result
+
+
+'''
+Peak resident memory of this process so far in KB, or None where the platform doesn't report it.
+It never goes down, so it is the largest run up to now rather than the current one.
+'''
+def processPeakRssKB():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak # macOS reports bytes, Linux KB
+
+def currentCommit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+'''
+Runs every depth up to maxDepth of one reference position and returns one result dict per depth.
+Memory is the run's own Python heap peak (heapPeakKB) with traceMemory, else the process peak
+RSS so far (processPeakRssKB).
+'''
+def runPosition(name, fen, expected, maxDepth, backend, traceMemory=False):
+    results = []
+    for depth in range(1, min(maxDepth, len(expected)) + 1):
+        gs = chessEngine.GameState(backend=backend, fen=fen)
+        if traceMemory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        nodes = perft(gs, depth)
+        seconds = time.perf_counter() - start
+        if traceMemory:
+            memory = ("heapPeakKB", tracemalloc.get_traced_memory()[1] // 1024)
+            tracemalloc.stop()
+        else:
+            memory = ("processPeakRssKB", processPeakRssKB())
+        results.append({
+            "position": name, "backend": backend, "depth": depth,
+            "nodes": nodes, "expected": expected[depth - 1], "ok": nodes == expected[depth - 1],
+            "seconds": round(seconds, 4), "nps": int(nodes / seconds) if seconds > 0 else 0,
+            memory[0]: memory[1],
+        })
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Perft correctness and speed suite")
+    parser.add_argument("--depth", type=int, default=3, help="deepest depth to run for each position")
+    parser.add_argument("--backend", choices=["list", "bitboard", "both"], default="both")
+    parser.add_argument("--positions", nargs="+", help="reference positions to run (default: all)")
+    parser.add_argument("--json", help="write results as JSON lines to this file ('-' for stdout)")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="report the Python heap peak of each run via tracemalloc (slow) instead of process peak RSS")
+    parser.add_argument("--stats", help="time the move generation hot paths (slows the run) and write the stats as JSON to this file ('-' for stdout)")
+    parser.add_argument("--divide", nargs=2, metavar=("FEN", "DEPTH"), help="print a per-move breakdown and exit")
+    args = parser.parse_args(argv)
+    backends = ["list", "bitboard"] if args.backend == "both" else [args.backend]
+    if args.stats:
+        chessProfile.enable()
+
+    if args.divide:
+        fen, depth = args.divide[0], int(args.divide[1])
+        for backend in backends:
+            result = divide(chessEngine.GameState(backend=backend, fen=fen), depth)
+            for move in sorted(result):
+                print(move + ": " + str(result[move]))
+            print("Total (" + backend + "): " + str(sum(result.values())))
+        return 0
+
+    commit = currentCommit()
+    out = None
+    if args.json == "-":
+        out = sys.stdout
+    elif args.json:
+        out = open(args.json, "w")
+    failures = 0
+    for name, fen, expected in referencePositions:
+        if args.positions and name not in args.positions:
+            continue
+        for backend in backends:
+            for result in runPosition(name, fen, expected, args.depth, backend, args.trace_memory):
+                result["commit"] = commit
+                if not result["ok"]:
+                    failures += 1
+                if out is not None:
+                    out.write(json.dumps(result) + "\n")
+                if out is not sys.stdout:
+                    memory = "heap peak %s KB" % result["heapPeakKB"] if args.trace_memory else \
+                        "process peak %s KB" % result["processPeakRssKB"]
+                    print("%-10s %-8s depth %d  %10d nodes  %s  %8.3fs  %8d nps  %s" % (
+                        name, backend, result["depth"], result["nodes"], "ok  " if result["ok"] else "FAIL",
+                        result["seconds"], result["nps"], memory))
+    if out is not None and out is not sys.stdout:
+        out.close()
+    if args.stats:
+        chessProfile.export(args.stats)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
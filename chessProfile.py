@@ -0,0 +1,247 @@
+"""
+Instrumentation - call counts, timings and histograms for the engine's hot paths, optional
+cProfile and sampling profiles, and a JSON export of everything collected.
+
+Nothing is measured until enable() is called. It swaps timing wrappers into GameState,
+BitboardBoard and Search, and disable() puts the original methods back, so a disabled engine
+runs exactly the code it runs without this module. Setting CHESS_STATS=FILE makes the entry
+points that call enableFromEnvironment() collect stats and write them to FILE on exit.
+"""
+
+import atexit
+import cProfile
+import functools
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+import chessBitboard
+import chessEngine
+import chessSearch
+
+# Methods timed by enable(), by class
+hotPaths = [
+    (chessEngine.GameState, ["getValidMoves", "getValidMoveCodes", "getAllPossibleMoves",
+                             "getPawnMoves", "getRookMoves", "getKnightMoves", "getBishopMoves",
+                             "getQueenMoves", "getKingMoves", "squareUnderAttack",
+                             "makeMove", "undoMove", "makeMoveCode", "undoMoveCode"]),
+    (chessBitboard.BitboardBoard, ["generateLegalMoves", "generateMoves", "isSquareAttacked"]),
+    (chessSearch.Search, ["iterativeDeepening"]),
+]
+
+
+class Stats():
+    '''
+    Histograms count values by power of two - the bucket for n holds the values below n
+    (and at least n / 2), so a few buckets cover nanoseconds to seconds.
+    '''
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.counters = Counter()
+        self.timers = {} # name -> [calls, total ns, max ns, histogram of ns]
+        self.histograms = {}
+        self.samples = Counter() # Sampler hits by innermost function
+        self.inclusiveSamples = Counter() # Sampler hits by every function on the stack
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+
+    def observe(self, name, value):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Counter()
+        histogram[1 << int(value).bit_length()] += 1
+
+    def time(self, name, ns):
+        timer = self.timers.get(name)
+        if timer is None:
+            timer = self.timers[name] = [0, 0, 0, Counter()]
+        timer[0] += 1
+        timer[1] += ns
+        if ns > timer[2]:
+            timer[2] = ns
+        timer[3][1 << ns.bit_length()] += 1
+
+    def toDict(self):
+        timers = {}
+        for name, (calls, total, longest, histogram) in sorted(self.timers.items(), key=lambda item: -item[1][1]):
+            timers[name] = {"calls": calls, "totalMs": round(total / 1e6, 3), "meanUs": round(total / calls / 1e3, 3),
+                            "maxUs": round(longest / 1e3, 3), "histogramNs": histogramDict(histogram)}
+        return {
+            "enabled": enabled,
+            "timers": timers,
+            "counters": dict(self.counters),
+            "histograms": {name: histogramDict(histogram) for name, histogram in self.histograms.items()},
+            "samples": dict(self.samples.most_common(50)),
+            "inclusiveSamples": dict(self.inclusiveSamples.most_common(50)),
+        }
+
+def histogramDict(histogram):
+    return {str(bound): histogram[bound] for bound in sorted(histogram)}
+
+stats = Stats()
+enabled = False
+
+
+'''
+Extra measurements taken from a timed method's result, by method name.
+'''
+def afterValidMoveCodes(result):
+    stats.observe("GameState.getValidMoveCodes.moves", len(result))
+
+def afterIterativeDeepening(result):
+    info = result[2]
+    stats.count("Search.nodes", info['nodes'])
+    stats.observe("Search.depth", info['depth'])
+    stats.observe("Search.nps", info['nps'])
+
+afterHooks = {"getValidMoveCodes": afterValidMoveCodes, "iterativeDeepening": afterIterativeDeepening}
+
+def timed(name, method, after=None):
+    clock = time.perf_counter_ns
+    record = stats.time
+
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        start = clock()
+        try:
+            result = method(*args, **kwargs)
+        finally:
+            record(name, clock() - start)
+        if after is not None:
+            after(result)
+        return result
+    wrapper.original = method
+    return wrapper
+
+
+'''
+Starts timing the hot paths. GameStates created earlier keep their per-piece move functions
+bound to the untimed methods - pass them in to have those rebound as well.
+'''
+def enable(gameStates=()):
+    global enabled
+    if not enabled:
+        for cls, names in hotPaths:
+            for name in names:
+                setattr(cls, name, timed(cls.__name__ + "." + name, getattr(cls, name), afterHooks.get(name)))
+        enabled = True
+    for gs in gameStates:
+        bindMoveFunctions(gs)
+
+'''
+Puts the original methods back. Collected stats are kept until stats.reset().
+'''
+def disable(gameStates=()):
+    global enabled
+    if enabled:
+        for cls, names in hotPaths:
+            for name in names:
+                setattr(cls, name, getattr(cls, name).original)
+        enabled = False
+    for gs in gameStates:
+        bindMoveFunctions(gs)
+
+def bindMoveFunctions(gs):
+    gs.moveFunctions = {kind: getattr(gs, method.__name__) for kind, method in gs.moveFunctions.items()}
+
+'''
+Enables stats if CHESS_STATS is set and writes them to that file when the process exits.
+Returns whether stats are on.
+'''
+def enableFromEnvironment():
+    path = os.environ.get("CHESS_STATS")
+    if not path:
+        return False
+    enable()
+    atexit.register(export, path)
+    return True
+
+'''
+Everything collected so far as a dict, also written as JSON to path if given ('-' for stdout).
+'''
+def export(path=None):
+    data = stats.toDict()
+    if path == "-":
+        json.dump(data, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    elif path:
+        with open(path, "w") as f:
+            json.dump(data, f, indent=2)
+    return data
+
+
+'''
+Runs the with block under cProfile. The raw profile is written to path (for snakeviz, pstats, ...)
+if given, otherwise the top functions by cumulative time are printed to stderr.
+'''
+@contextmanager
+def profile(path=None, limit=30):
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        if path:
+            profiler.dump_stats(path)
+        else:
+            pstats.Stats(profiler, stream=sys.stderr).sort_stats("cumulative").print_stats(limit)
+
+
+class Sampler():
+    '''
+    Statistical profiler - a background thread looks at the stack of one thread (by default
+    the one that creates the Sampler) every interval seconds and counts the functions on it.
+    Much cheaper than cProfile for long runs; the counts go into stats.samples when it stops.
+    '''
+    def __init__(self, interval=0.001, thread=None):
+        self.interval = interval
+        self.threadId = (thread or threading.current_thread()).ident
+        self.samples = Counter()
+        self.inclusiveSamples = Counter()
+        self.running = threading.Event()
+        self.thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        self.running.set()
+        self.thread = threading.Thread(target=self.run, name="chessProfile.Sampler", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running.clear()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        stats.samples.update(self.samples)
+        stats.inclusiveSamples.update(self.inclusiveSamples)
+
+    def run(self):
+        while self.running.is_set():
+            frame = sys._current_frames().get(self.threadId)
+            if frame is not None:
+                self.samples[frameName(frame)] += 1
+                seen = set()
+                while frame is not None:
+                    seen.add(frameName(frame))
+                    frame = frame.f_back
+                self.inclusiveSamples.update(seen)
+            time.sleep(self.interval)
+
+def frameName(frame):
+    code = frame.f_code
+    return os.path.basename(code.co_filename) + ":" + code.co_name
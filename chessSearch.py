@@ -0,0 +1,361 @@
+"""
+Move search for GameState.
+Negamax alpha-beta with quiescence search, iterative deepening under a time budget
+and a transposition table keyed by GameState.hash().
+"""
+
+import time
+
+import chessEngine
+from chessBitboard import captureFlag, promotionShift
+
+mateScore = 100000
+maxPly = 64
+pieceValues = {'p': 100, 'N': 320, 'B': 330, 'R': 500, 'Q': 900, 'K': 0} # Move ordering only
+
+
+class TranspositionTable():
+    exact, lowerBound, upperBound = 0, 1, 2
+
+    '''
+    Fixed number of slots (rounded down to a power of two), indexed by the low bits of the key.
+    '''
+    def __init__(self, size=1 << 18):
+        self.size = 1 << (size.bit_length() - 1)
+        self.mask = self.size - 1
+        self.keys = [0] * self.size
+        self.entries = [None] * self.size # (depth, score, flag, move, generation)
+        self.generation = 0
+
+    '''
+    Called at the start of every search so entries from earlier searches can be replaced first.
+    '''
+    def newSearch(self):
+        self.generation += 1
+
+    def probe(self, key):
+        i = key & self.mask
+        if self.keys[i] == key:
+            return self.entries[i]
+        return None
+
+    '''
+    Replace-by-depth - a slot keeps its entry unless the new one is for the same position,
+    searched at least as deep, or the old one is left over from a previous search.
+    '''
+    def store(self, key, depth, score, flag, move):
+        i = key & self.mask
+        entry = self.entries[i]
+        if entry is None or self.keys[i] == key or depth >= entry[0] or entry[4] != self.generation:
+            self.keys[i] = key
+            self.entries[i] = (depth, score, flag, move, self.generation)
+
+    def clear(self):
+        self.keys = [0] * self.size
+        self.entries = [None] * self.size
+
+
+class Search():
+    '''
+    book (a chessBook.OpeningBook) and tablebase (a chessTablebase.Tablebase) are optional and
+    consulted before searching - a hit is returned without searching at all.
+    '''
+    def __init__(self, tt=None, book=None, tablebase=None):
+        self.tt = tt if tt is not None else TranspositionTable()
+        self.book = book
+        self.tablebase = tablebase
+        self.buffers = chessEngine.moveBuffers(maxPly + 1)
+        self.killers = [[0, 0] for _ in range(maxPly + 1)]
+        self.history = [[0] * 4096, [0] * 4096] # [white, black][start square | end square << 6]
+        self.nodes = 0
+        self.stopped = False
+        self.deadline = None
+        self.stopEvent = None # Optional multiprocessing.Event another process can set to stop the search
+
+    '''
+    Asks a running search to finish; it returns the best move of the last completed depth.
+    '''
+    def stop(self):
+        self.stopped = True
+
+    '''
+    Iterative deepening - searches depth startDepth, startDepth + 1, ... until maxDepth or the time runs out.
+    report, if given, is called with an info dict after every completed depth.
+    Returns (best move code, score, info) where info has depth, nodes, nps, time and pv.
+    '''
+    def iterativeDeepening(self, gs, timeMs=None, maxDepth=maxPly, report=None, startDepth=1):
+        startTime = time.perf_counter()
+        self.deadline = startTime + timeMs / 1000 if timeMs is not None else None
+        self.stopped = False
+        self.nodes = 0
+        self.killers = [[0, 0] for _ in range(maxPly + 1)]
+        for side in self.history:
+            for i in range(4096):
+                side[i] >>= 1 # Keep what was learnt, but let the new position outweigh it
+        self.tt.newSearch()
+        checkMate, staleMate = gs.checkMate, gs.staleMate
+
+        bestMove, bestScore = 0, 0
+        info = {'depth': 0, 'score': 0, 'nodes': 0, 'nps': 0, 'timeMs': 0, 'pv': []}
+        rootMoves = gs.getValidMoveCodes([])
+        known = self.probeRoot(gs) if rootMoves else None
+        if known is not None:
+            bestMove, bestScore = known
+            info = {'depth': 0, 'score': bestScore, 'nodes': 0, 'nps': 0,
+                    'timeMs': int((time.perf_counter() - startTime) * 1000), 'pv': [bestMove]}
+            if report is not None:
+                report(info)
+        elif rootMoves:
+            bestMove = rootMoves[0]
+            for depth in range(min(startDepth, maxDepth), maxDepth + 1):
+                score = self.negamax(gs, depth, -mateScore - 1, mateScore + 1, 0)
+                if self.stopped:
+                    break
+                entry = self.tt.probe(gs.hash())
+                if entry is not None and entry[3]:
+                    bestMove = entry[3]
+                bestScore = score
+                elapsed = time.perf_counter() - startTime
+                info = {'depth': depth, 'score': score, 'nodes': self.nodes,
+                        'nps': int(self.nodes / elapsed) if elapsed > 0 else 0,
+                        'timeMs': int(elapsed * 1000), 'pv': self.principalVariation(gs, depth)}
+                if report is not None:
+                    report(info)
+                if abs(score) >= mateScore - maxPly:
+                    break # Forced mate found - deeper searches can't change the result
+                if self.deadline is not None and time.perf_counter() > startTime + (self.deadline - startTime) / 2:
+                    break # The next depth would not finish in the time left
+        gs.checkMate, gs.staleMate = checkMate, staleMate
+        return bestMove, bestScore, info
+
+    '''
+    Move from the opening book or the tablebase as (move code, score), or None if neither knows the position.
+    Book moves score 0; tablebase moves get the mate score of their distance to mate.
+    '''
+    def probeRoot(self, gs):
+        if self.book is not None:
+            code = self.book.probe(gs)
+            if code:
+                return code, 0
+        if self.tablebase is not None:
+            result = self.tablebase.bestMove(gs)
+            if result is not None:
+                code, wdl, distance = result
+                return code, mateScore - distance if wdl > 0 else -mateScore + distance if wdl < 0 else 0
+        return None
+
+    '''
+    Called for every node (negamax and quiescence) - every 256 nodes looks at the clock and
+    the stop event. Returns True once the search has to stop.
+    '''
+    def checkStop(self):
+        self.nodes += 1
+        if self.nodes & 255 == 0:
+            if (self.deadline is not None and time.perf_counter() > self.deadline) or \
+                    (self.stopEvent is not None and self.stopEvent.is_set()):
+                self.stopped = True
+        return self.stopped
+
+    def negamax(self, gs, depth, alpha, beta, ply):
+        if self.checkStop():
+            return 0
+        if ply > 0 and (gs.halfmoveClock >= 100 or self.isRepetition(gs)):
+            return 0
+        if depth <= 0 or ply >= maxPly:
+            return self.quiescence(gs, alpha, beta, ply)
+
+        key = gs.hash()
+        alphaStart = alpha
+        ttMove = 0
+        entry = self.tt.probe(key)
+        if entry is not None:
+            ttMove = entry[3]
+            if ply > 0 and entry[0] >= depth:
+                score = scoreFromTT(entry[1], ply)
+                if entry[2] == TranspositionTable.exact:
+                    return score
+                if entry[2] == TranspositionTable.lowerBound and score >= beta:
+                    return score
+                if entry[2] == TranspositionTable.upperBound and score <= alpha:
+                    return score
+
+        moves = self.buffers[ply]
+        del moves[:]
+        gs.getValidMoveCodes(moves)
+        if len(moves) == 0:
+            return -mateScore + ply if gs.checkMate else 0
+
+        bestScore = -mateScore - 1
+        bestMove = 0
+        side = 0 if gs.whitetoMove else 1
+        for code in self.orderMoves(gs, moves, ttMove, ply):
+            gs.makeMoveCode(code)
+            score = -self.negamax(gs, depth - 1, -beta, -alpha, ply + 1)
+            gs.undoMoveCode()
+            if self.stopped:
+                return 0
+            if score > bestScore:
+                bestScore = score
+                bestMove = code
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        if not code & captureFlag:
+                            # Quiet move refuted the line - remember it for sibling nodes and later searches
+                            killers = self.killers[ply]
+                            if killers[0] != code:
+                                killers[1] = killers[0]
+                                killers[0] = code
+                            self.history[side][code & 4095] += depth * depth
+                        break
+
+        if bestScore >= beta:
+            flag = TranspositionTable.lowerBound
+        elif bestScore > alphaStart:
+            flag = TranspositionTable.exact
+        else:
+            flag = TranspositionTable.upperBound
+        self.tt.store(key, depth, scoreToTT(bestScore, ply), flag, bestMove)
+        return bestScore
+
+    '''
+    Only captures and promotions are searched until the position is quiet,
+    so the static evaluation is never taken in the middle of an exchange.
+    '''
+    def quiescence(self, gs, alpha, beta, ply):
+        if self.stopped:
+            return 0
+        standPat = gs.evaluate()
+        if standPat >= beta or ply >= maxPly:
+            return standPat
+        if standPat > alpha:
+            alpha = standPat
+        moves = self.buffers[ply]
+        del moves[:]
+        gs.getValidMoveCodes(moves)
+        if len(moves) == 0:
+            return -mateScore + ply if gs.checkMate else 0
+        for code in self.orderMoves(gs, moves, 0, ply, capturesOnly=True):
+            gs.makeMoveCode(code)
+            if self.checkStop():
+                gs.undoMoveCode()
+                return 0
+            score = -self.quiescence(gs, -beta, -alpha, ply + 1)
+            gs.undoMoveCode()
+            if self.stopped:
+                return 0
+            if score >= beta:
+                return score
+            if score > alpha:
+                alpha = score
+        return alpha
+
+    '''
+    Hash move first, then captures by MVV-LVA (most valuable victim, least valuable attacker),
+    then killer moves, then the remaining quiet moves by history score.
+    The ordering score is packed above the move code so the list sorts in C without a key function.
+    '''
+    def orderMoves(self, gs, moves, ttMove, ply, capturesOnly=False):
+        board = gs.board
+        killers = self.killers[ply]
+        history = self.history[0 if gs.whitetoMove else 1]
+        ordered = []
+        for code in moves:
+            if code == ttMove:
+                score = 3000000
+            elif code & captureFlag or code >> promotionShift & 7:
+                endSq = (code >> 6) & 63
+                victim = board[endSq >> 3][endSq & 7]
+                attacker = board[(code & 63) >> 3][code & 7]
+                score = 2000000 + (pieceValues[victim[1]] if victim != "--" else 100) * 10 - pieceValues[attacker[1]]
+                if code >> promotionShift & 7 == 4:
+                    score += 9000
+            elif capturesOnly:
+                continue
+            elif code == killers[0]:
+                score = 1000002
+            elif code == killers[1]:
+                score = 1000001
+            else:
+                score = min(history[code & 4095], 999999)
+            ordered.append(score << 18 | code)
+        ordered.sort(reverse=True)
+        return [packed & 0x3FFFF for packed in ordered]
+
+    '''
+    True if the current position already occurred since the last capture or pawn move.
+    '''
+    def isRepetition(self, gs):
+        key = gs.zobristKey
+        keys = gs.zobristKeyLog
+        log = gs.moveCodeLog
+        i = len(log) - 1
+        while i >= 0:
+            code, pieceMoved, pieceCaptured = log[i]
+            if pieceCaptured != "--" or pieceMoved[1] == 'p':
+                return False
+            if keys[i] == key:
+                return True
+            i -= 1
+        return False
+
+    '''
+    Follows the best moves stored in the transposition table from the current position.
+    '''
+    def principalVariation(self, gs, depth):
+        pv = []
+        seen = set()
+        while len(pv) < depth:
+            entry = self.tt.probe(gs.hash())
+            if entry is None or not entry[3] or gs.hash() in seen or entry[3] not in gs.getValidMoveCodes([]):
+                break
+            seen.add(gs.hash())
+            pv.append(entry[3])
+            gs.makeMoveCode(entry[3])
+        for _ in pv:
+            gs.undoMoveCode()
+        return pv
+
+
+'''
+Mate scores are stored relative to the node, so they stay correct when the position is reached at another ply.
+'''
+def scoreToTT(score, ply):
+    if score >= mateScore - maxPly:
+        return score + ply
+    if score <= -mateScore + maxPly:
+        return score - ply
+    return score
+
+def scoreFromTT(score, ply):
+    if score >= mateScore - maxPly:
+        return score - ply
+    if score <= -mateScore + maxPly:
+        return score + ply
+    return score
+
+
+'''
+A line of move codes from the current position as UCI strings, e.g. a principal variation.
+'''
+def pvToUci(gs, pv):
+    line = []
+    for code in pv:
+        line.append(chessEngine.Move.fromCode(code, gs.board).getUciNotation())
+        gs.makeMoveCode(code)
+    for _ in pv:
+        gs.undoMoveCode()
+    return line
+
+
+'''
+Best move for the side to move within timeMs milliseconds, as a Move (None if there are no legal moves).
+Pass the same Search to keep its transposition table and history between calls.
+'''
+def findBestMove(gs, timeMs, maxDepth=maxPly, search=None, report=None):
+    if search is None:
+        search = Search()
+    code, score, info = search.iterativeDeepening(gs, timeMs, maxDepth, report)
+    if not code:
+        return None
+    return chessEngine.Move.fromCode(code, gs.board)
@@ -0,0 +1,210 @@
+"""
+Endgame tablebases - exact results for positions with few pieces, probed before searching.
+Tablebase is the probe interface; a reader for files built elsewhere (e.g. Syzygy) implements probe().
+GeneratedTablebase builds its own tables by retrograde analysis, for a king and one piece
+against a bare king - small enough to generate in pure Python, e.g. for tests.
+"""
+
+from array import array
+from collections import deque
+
+import chessBitboard
+from chessBitboard import kingAttacks, knightAttacks, rookAttacks, bishopAttacks, betweenMasks
+
+
+class Tablebase():
+    maxPieces = 0 # Positions with more pieces (kings included) are never probed
+
+    '''
+    (wdl, distance) for the side to move - wdl is 1 for a win, 0 for a draw, -1 for a loss and
+    distance the number of plies to mate (0 for draws). None if the position is not in the tables.
+    '''
+    def probe(self, gs):
+        return None
+
+    '''
+    The best legal move by the tables as (move code, wdl, distance) - the fastest win, else a draw,
+    else the slowest loss. None if the position, or any position a move leads to, is not covered.
+    '''
+    def bestMove(self, gs):
+        if self.pieceCount(gs) > self.maxPieces:
+            return None
+        best = None
+        bestRank = None
+        for code in gs.getValidMoveCodes([]):
+            gs.makeMoveCode(code)
+            result = self.probe(gs)
+            gs.undoMoveCode()
+            if result is None:
+                return None
+            wdl, distance = -result[0], result[1] + 1
+            rank = (wdl, -distance if wdl > 0 else distance if wdl < 0 else 0)
+            if best is None or rank > bestRank:
+                best, bestRank = (code, wdl, distance if wdl else 0), rank
+        return best
+
+    def pieceCount(self, gs):
+        return sum(1 for row in gs.board for piece in row if piece != "--")
+
+
+class GeneratedTablebase(Tablebase):
+    maxPieces = 3
+    win, loss = 1, 2
+
+    '''
+    pieces - which king + piece vs king endings to cover, any of "QRBN". The tables are generated
+    here (a few seconds for Q and R, well under one for B and N), never while probing; with
+    load=False nothing is covered until load() is called, e.g. from a background thread.
+    '''
+    def __init__(self, pieces="QRBN", load=True):
+        self.pieces = pieces
+        self.tables = {}
+        if load:
+            self.load()
+
+    '''
+    Generates every table not built yet.
+    '''
+    def load(self):
+        for kind in self.pieces:
+            if kind not in self.tables:
+                self.tables[kind] = generate(kind)
+
+    '''
+    Positions are looked up with the side that has the piece as white - a table index is
+    ((side to move * 64 + strong king) * 64 + weak king) * 64 + piece square, side to move 0 for the strong side.
+    '''
+    def probe(self, gs):
+        if gs.castleRights:
+            return None
+        others = []
+        kings = {}
+        for r in range(8):
+            for c in range(8):
+                piece = gs.board[r][c]
+                if piece == "--":
+                    continue
+                if piece[1] == 'K':
+                    kings[piece[0]] = r * 8 + c
+                else:
+                    others.append((piece, r * 8 + c))
+        if not others:
+            return (0, 0) if len(kings) == 2 else None
+        if len(others) > 1 or others[0][0][1] not in self.tables:
+            return None # Not covered, or its table isn't loaded yet
+        (color, kind), sq = others[0]
+        if color == 'w':
+            strongKing, weakKing, strongToMove = kings['w'], kings['b'], gs.whitetoMove
+        else:
+            strongKing, weakKing, sq, strongToMove = kings['b'] ^ 56, kings['w'] ^ 56, sq ^ 56, not gs.whitetoMove
+        results, distances = self.tables[kind]
+        index = (((0 if strongToMove else 1) * 64 + strongKing) * 64 + weakKing) * 64 + sq
+        result = results[index]
+        if result == self.win:
+            return (1, distances[index])
+        if result == self.loss:
+            return (-1, distances[index])
+        return (0, 0)
+
+
+'''
+Attack function (square, occupancy) -> bitboard for a piece kind.
+'''
+def attackFunction(kind):
+    if kind == 'N':
+        return lambda sq, occupancy: knightAttacks[sq]
+    if kind == 'B':
+        return bishopAttacks
+    if kind == 'R':
+        return rookAttacks
+    return lambda sq, occupancy: rookAttacks(sq, occupancy) | bishopAttacks(sq, occupancy)
+
+def squares(bitboard):
+    while bitboard:
+        low = bitboard & -bitboard
+        yield low.bit_length() - 1
+        bitboard ^= low
+
+'''
+Retrograde analysis of king + kind (white) against a bare king (black).
+Starts from every checkmate and works backwards: a white-to-move position is won as soon as one
+move reaches a lost black position, a black-to-move position is lost once every black move reaches
+a won white position. Everything left over is a draw. Returns (results, distances in plies).
+'''
+def generate(kind):
+    chessBitboard.initTables()
+    size = 2 * 64 * 64 * 64
+    results = bytearray(size) # 0 = draw or unknown, else GeneratedTablebase.win/loss for the side to move
+    distances = array('H', bytes(2 * size))
+    movesLeft = array('b', bytes(size)) # Black moves not yet known to lose; -1 once black is safe or done
+    queue = deque()
+    win, loss = GeneratedTablebase.win, GeneratedTablebase.loss
+    attacks = attackFunction(kind)
+    kingSquares = [list(squares(kingAttacks[sq])) for sq in range(64)]
+    # Whether the piece gives check - it reaches the king on an empty board and nothing stands between them
+    emptyAttacks = [attacks(sq, 0) for sq in range(64)]
+    checks = lambda sq, king, occupancy: emptyAttacks[sq] >> king & 1 and not betweenMasks[sq][king] & occupancy
+
+    for wk in range(64):
+        for bk in range(64):
+            if bk == wk or kingAttacks[wk] >> bk & 1:
+                continue
+            for x in range(64):
+                if x == wk or x == bk:
+                    continue
+                index = ((64 + wk) * 64 + bk) * 64 + x # Black to move
+                occupancy = 1 << wk | 1 << bk | 1 << x
+                inCheck = checks(x, bk, occupancy)
+                covered = attacks(x, occupancy ^ 1 << bk) | kingAttacks[wk] | 1 << wk
+                moves = 0
+                safe = False
+                for to in kingSquares[bk]:
+                    if to == x:
+                        safe = not kingAttacks[wk] >> x & 1 # Takes the piece - bare kings
+                    elif not covered >> to & 1:
+                        moves += 1
+                if safe or (moves == 0 and not inCheck):
+                    movesLeft[index] = -1
+                elif moves == 0:
+                    results[index] = loss # Checkmate
+                    movesLeft[index] = -1
+                    queue.append(index)
+                else:
+                    movesLeft[index] = moves
+
+    while queue:
+        index = queue.popleft()
+        distance = distances[index] + 1
+        x = index & 63
+        bk = index >> 6 & 63
+        wk = index >> 12 & 63
+        occupancy = 1 << wk | 1 << bk | 1 << x
+        if index >> 18:
+            # Black to move and lost - every white move that leads here wins
+            blocked = kingAttacks[bk] | occupancy
+            for fromSq in kingSquares[wk]:
+                if not blocked >> fromSq & 1 and not checks(x, bk, occupancy ^ 1 << wk | 1 << fromSq):
+                    previous = (fromSq * 64 + bk) * 64 + x
+                    if not results[previous]:
+                        results[previous] = win
+                        distances[previous] = distance
+                        queue.append(previous)
+            for fromSq in squares(attacks(x, occupancy) & ~occupancy):
+                if not checks(fromSq, bk, occupancy ^ 1 << x):
+                    previous = (wk * 64 + bk) * 64 + fromSq
+                    if not results[previous]:
+                        results[previous] = win
+                        distances[previous] = distance
+                        queue.append(previous)
+        else:
+            # White to move and won - one fewer way out for every black position that can move here
+            blocked = kingAttacks[wk] | occupancy
+            for fromSq in kingSquares[bk]:
+                previous = ((64 + wk) * 64 + fromSq) * 64 + x
+                if not blocked >> fromSq & 1 and movesLeft[previous] > 0:
+                    movesLeft[previous] -= 1
+                    if movesLeft[previous] == 0:
+                        results[previous] = loss
+                        distances[previous] = distance
+                        queue.append(previous)
+    return results, distances
@@ -0,0 +1,157 @@
+"""
+Batched position encoding and evaluation with NumPy, for scoring large sets of positions offline.
+A batch of GameStates and/or FEN strings becomes an N x 12 x 64 array of piece planes (one plane
+per piece in chessBitboard.pieceNames order, squares indexed like GameState.board) plus side to move
+and castling features; the whole batch is then scored with the chessEval tables in one call.
+The work per square is done by NumPy - Python only touches each position once.
+
+NumPy is optional: the rest of the engine runs without it, only this module needs it.
+"""
+
+import chessEngine
+import chessEval
+from chessBitboard import pieceNames
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+fenPieces = "PNBRQKpnbrqk" # FEN letters in pieceNames order
+fenExpand = str.maketrans({str(n): "." * n for n in range(1, 9)} | {"/": ""}) # "3p4/" -> "...p...."
+castleBits = (chessEngine.wks, chessEngine.wqs, chessEngine.bks, chessEngine.bqs) # KQkq feature order
+castleHomes = (("K", 60, "R", 63), ("K", 60, "R", 56), ("k", 4, "r", 7), ("k", 4, "r", 0)) # King and rook squares, KQkq order
+
+
+def requireNumpy():
+    if np is None:
+        raise ImportError("chessTensor needs NumPy - pip install numpy")
+
+'''
+Encodes a list of GameStates and/or FEN strings, keeping their order.
+Returns (planes, sideToMove, castling):
+planes is N x 12 x 64 with a 1 where that piece stands, sideToMove is 1 where white is to move
+and castling is N x 4 with the K, Q, k, q rights. Raises ValueError for a malformed FEN.
+'''
+def encodePositions(positions, dtype=None):
+    requireNumpy()
+    positions = list(positions)
+    fenIndices = [i for i, position in enumerate(positions) if isinstance(position, str)]
+    if len(fenIndices) == len(positions):
+        return encodeFens(positions, dtype)
+    if not fenIndices:
+        return encodeGameStates(positions, dtype)
+    stateIndices = [i for i, position in enumerate(positions) if not isinstance(position, str)]
+    planes = np.empty((len(positions), 12, 64), dtype=dtype or np.uint8)
+    sideToMove = np.empty(len(positions), dtype=np.uint8)
+    castling = np.empty((len(positions), 4), dtype=np.uint8)
+    for indices, encoded in ((fenIndices, encodeFens([positions[i] for i in fenIndices], dtype)),
+                             (stateIndices, encodeGameStates([positions[i] for i in stateIndices], dtype))):
+        planes[indices], sideToMove[indices], castling[indices] = encoded
+    return planes, sideToMove, castling
+
+'''
+GameState boards are turned into one N x 64 array of piece strings and compared against all
+twelve piece names at once.
+'''
+def encodeGameStates(states, dtype=None):
+    requireNumpy()
+    count = len(states)
+    boards = np.array([gs.board for gs in states], dtype="<U2").reshape(count, 1, 64)
+    planes = (boards == np.array(pieceNames).reshape(1, 12, 1)).astype(dtype or np.uint8)
+    sideToMove = np.array([gs.whitetoMove for gs in states], dtype=np.uint8)
+    rights = np.array([gs.castleRights for gs in states], dtype=np.uint8).reshape(count, 1)
+    castling = (rights & np.array(castleBits, dtype=np.uint8) != 0).astype(np.uint8)
+    return planes, sideToMove, castling
+
+'''
+FEN boards are expanded to 64 characters each ('.' for an empty square), read as one byte
+array and compared against the twelve FEN piece letters at once. Everything GameState.loadFen
+checks is checked here too except whether the side not to move is in check, and castling rights
+whose king or rook has left its home square are dropped the same way.
+'''
+def encodeFens(fens, dtype=None):
+    requireNumpy()
+    fields = [fen.split() for fen in fens]
+    for fen, parts in zip(fens, fields):
+        if len(parts) < 4:
+            raise ValueError("FEN needs at least 4 fields: " + fen)
+        ranks = parts[0].split("/")
+        if len(ranks) != 8:
+            raise ValueError("FEN board needs 8 ranks: " + fen)
+        for rank in ranks:
+            if len(rank.translate(fenExpand)) != 8:
+                raise ValueError("FEN rank '" + rank + "' is not 8 squares: " + fen)
+        if parts[1] not in ("w", "b"):
+            raise ValueError("FEN side to move must be 'w' or 'b': " + fen)
+        for letter in parts[2] if parts[2] != "-" else "":
+            if letter not in "KQkq":
+                raise ValueError("Unknown castling right '" + letter + "' in FEN: " + fen)
+    squares = [parts[0].translate(fenExpand) for parts in fields]
+    files, ranks = chessEngine.Move.filesToCols, chessEngine.Move.ranksToRows
+    for fen, parts, board in zip(fens, fields, squares):
+        if parts[3] != "-":
+            enPassant = parts[3]
+            if len(enPassant) != 2 or enPassant[0] not in files or enPassant[1] not in ranks:
+                raise ValueError("Bad en passant square in FEN: " + fen)
+            sq = ranks[enPassant[1]] * 8 + files[enPassant[0]]
+            # The pawn that just made a double step stands in front of the square it skipped
+            pawnSq, enemyPawn, row = (sq + 8, "p", 2) if parts[1] == "w" else (sq - 8, "P", 5)
+            if sq // 8 != row or board[sq] != "." or board[pawnSq] != enemyPawn:
+                raise ValueError("En passant square without a pawn that just moved two squares in FEN: " + fen)
+    count = len(fens)
+    data = np.frombuffer("".join(squares).encode("ascii", "replace"), dtype=np.uint8).reshape(count, 1, 64)
+    matches = data == np.frombuffer(fenPieces.encode("ascii"), dtype=np.uint8).reshape(1, 12, 1)
+    unknown = (data[:, 0] != ord(".")) & ~matches.any(axis=1)
+    if unknown.any():
+        raise ValueError("Unknown piece in FEN: " + fens[int(unknown.any(axis=1).argmax())])
+    kings = matches[:, (fenPieces.index("K"), fenPieces.index("k"))].sum(axis=2) != 1
+    if kings.any():
+        bad = int(kings.any(axis=1).argmax())
+        raise ValueError("FEN needs exactly one " + ("white" if kings[bad, 0] else "black") + " king: " + fens[bad])
+    backRankPawns = matches[:, (fenPieces.index("P"), fenPieces.index("p"))][:, :, np.r_[0:8, 56:64]].any(axis=(1, 2))
+    if backRankPawns.any():
+        raise ValueError("FEN has a pawn on the first or last rank: " + fens[int(backRankPawns.argmax())])
+    planes = matches.astype(dtype or np.uint8)
+    sideToMove = np.array([parts[1] == "w" for parts in fields], dtype=np.uint8)
+    requested = np.array([[letter in parts[2] for letter in "KQkq"] for parts in fields], dtype=bool).reshape(count, 4)
+    home = np.stack([matches[:, fenPieces.index(king), kingSq] & matches[:, fenPieces.index(rook), rookSq]
+                     for king, kingSq, rook, rookSq in castleHomes], axis=1)
+    castling = (requested & home).astype(np.uint8)
+    return planes, sideToMove, castling
+
+
+mgTable = egTable = phaseTable = None
+
+'''
+chessEval's tables as arrays - mg and eg are 12 x 64 (white positive), phase has one weight per piece.
+Built on first use.
+'''
+def evalTables():
+    global mgTable, egTable, phaseTable
+    requireNumpy()
+    if mgTable is None:
+        mgTable = np.array([chessEval.mgTables[piece] for piece in pieceNames], dtype=np.int64)
+        egTable = np.array([chessEval.egTables[piece] for piece in pieceNames], dtype=np.int64)
+        phaseTable = np.array([chessEval.piecePhase[piece] for piece in pieceNames], dtype=np.int64)
+    return mgTable, egTable, phaseTable
+
+'''
+Tapered material + piece-square score of every encoded position, from the side to move's point
+of view like GameState.evaluate() - identical results, as an int64 array.
+'''
+def evaluateBatch(planes, sideToMove):
+    mg, eg, phaseWeights = evalTables()
+    flat = planes.reshape(len(planes), 12 * 64)
+    mgScore = flat @ mg.reshape(12 * 64)
+    egScore = flat @ eg.reshape(12 * 64)
+    phase = np.minimum(planes.sum(axis=2, dtype=np.int64) @ phaseWeights, chessEval.totalPhase)
+    score = (mgScore * phase + egScore * (chessEval.totalPhase - phase)) // chessEval.totalPhase
+    return np.where(sideToMove != 0, score, -score)
+
+'''
+Encodes and scores a batch of GameStates and/or FENs in one call.
+'''
+def scorePositions(positions):
+    planes, sideToMove, castling = encodePositions(positions)
+    return evaluateBatch(planes, sideToMove)
@@ -0,0 +1,254 @@
+"""
+UCI front-end - lets a GUI, tournament manager or test harness drive the engine over stdin/stdout.
+Commands are read by an asyncio loop while the search runs on a worker thread, so stop, ponderhit
+and isready are answered in the middle of a search.
+
+Usage: python chessUci.py
+"""
+
+import asyncio
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import chessBook
+import chessEngine
+import chessProfile
+import chessSearch
+from chessSearch import mateScore, maxPly
+
+engineName = "chessEngine"
+defaultMoveTimeMs = 1000 # For a go with neither a clock, movetime, depth nor infinite
+
+
+class UciEngine():
+    def __init__(self, out=None, backend="bitboard"):
+        self.out = out if out is not None else sys.stdout
+        self.backend = backend
+        self.gs = chessEngine.GameState(backend=backend)
+        self.search = chessSearch.Search()
+        self.stopEvent = threading.Event() # Unlike Search.stop(), a stop that arrives before the search starts is not lost
+        self.search.stopEvent = self.stopEvent
+        self.worker = ThreadPoolExecutor(max_workers=1)
+        self.job = None
+        self.released = threading.Event() # Set by stop/ponderhit - until then bestmove is held back in infinite and ponder mode
+        self.ponderTimeMs = None # Time to use once a ponder search becomes a real one
+        self.ponderDeadline = None # Set by ponderhit; the search may not have started (and reset its deadline) yet
+        self.outputLock = threading.Lock()
+
+    def send(self, line):
+        with self.outputLock:
+            self.out.write(line + "\n")
+            self.out.flush()
+
+    '''
+    Handles one command line. Returns False once the engine should exit.
+    '''
+    def handle(self, line):
+        words = line.split()
+        if not words:
+            return True
+        command, args = words[0], words[1:]
+        if command == "uci":
+            self.send("id name " + engineName)
+            self.send("id author watermilan21")
+            self.send("option name BookFile type string default <empty>")
+            self.send("uciok")
+        elif command == "isready":
+            self.send("readyok")
+        elif command == "setoption":
+            self.setOption(args)
+        elif command == "ucinewgame":
+            self.waitForSearch()
+            self.search.tt.clear()
+        elif command == "position":
+            self.waitForSearch()
+            self.position(args)
+        elif command == "go":
+            self.waitForSearch()
+            self.go(args)
+        elif command == "stop":
+            self.stopEvent.set()
+            self.released.set()
+        elif command == "ponderhit":
+            if self.ponderTimeMs is not None:
+                self.ponderDeadline = time.perf_counter() + self.ponderTimeMs / 1000
+                self.search.deadline = self.ponderDeadline
+            self.ponderTimeMs = None
+            self.released.set()
+        elif command == "quit":
+            self.waitForSearch()
+            self.worker.shutdown(wait=True)
+            return False
+        else:
+            self.send("info string unknown command " + command)
+        return True
+
+    def setOption(self, args):
+        if "name" not in args:
+            return
+        valueAt = args.index("value") if "value" in args else len(args)
+        name = " ".join(args[args.index("name") + 1:valueAt])
+        value = " ".join(args[valueAt + 1:])
+        if name.lower() == "bookfile":
+            self.waitForSearch()
+            if self.search.book is not None:
+                self.search.book.close()
+            self.search.book = None
+            if value and value != "<empty>":
+                try:
+                    self.search.book = chessBook.OpeningBook(value)
+                except (OSError, ValueError) as e:
+                    self.send("info string cannot open book: " + str(e))
+
+    '''
+    position startpos [moves ...] / position fen FEN [moves ...]
+    '''
+    def position(self, args):
+        movesAt = args.index("moves") if "moves" in args else len(args)
+        try:
+            if args and args[0] == "fen":
+                gs = chessEngine.GameState(backend=self.backend, fen=" ".join(args[1:movesAt]))
+            else:
+                gs = chessEngine.GameState(backend=self.backend)
+        except ValueError as e:
+            self.send("info string " + str(e))
+            return
+        for uci in args[movesAt + 1:]:
+            code = findMoveCode(gs, uci)
+            if not code:
+                self.send("info string illegal move " + uci)
+                break
+            gs.makeMoveCode(code)
+        self.gs = gs
+
+    '''
+    go [wtime W btime B winc I binc I movestogo N] [movetime MS] [depth D] [infinite] [ponder]
+    '''
+    def go(self, args):
+        options = {}
+        for i, word in enumerate(args):
+            if word in ("wtime", "btime", "winc", "binc", "movestogo", "movetime", "depth") and i + 1 < len(args):
+                try:
+                    options[word] = int(args[i + 1])
+                except ValueError:
+                    self.send("info string bad number for " + word + ": " + args[i + 1])
+                    return
+        infinite = "infinite" in args
+        ponder = "ponder" in args
+        timeMs = None if infinite else allocateTime(options, self.gs.whitetoMove)
+        self.ponderTimeMs = timeMs if ponder else None
+        self.ponderDeadline = None
+        self.stopEvent.clear()
+        self.released.clear()
+        if not infinite and not ponder:
+            self.released.set()
+        self.job = self.worker.submit(self.think, self.gs, None if ponder else timeMs, options.get("depth", maxPly))
+
+    '''
+    Runs on the worker thread - searches, then reports the best move once the GUI allows it.
+    '''
+    def think(self, gs, timeMs, depth):
+        try:
+            code, score, info = self.search.iterativeDeepening(gs, timeMs, depth, lambda info: self.report(gs, info))
+            self.released.wait() # A finished infinite or ponder search still waits for stop/ponderhit
+            if not code:
+                self.send("bestmove 0000")
+                return
+            line = "bestmove " + chessEngine.Move.fromCode(code, gs.board).getUciNotation()
+            pv = info['pv']
+            if len(pv) > 1 and pv[0] == code:
+                line += " ponder " + chessSearch.pvToUci(gs, pv[:2])[1]
+            self.send(line)
+        except Exception as e: # Never leave the GUI waiting for a bestmove that will not come
+            self.send("info string search failed: " + repr(e))
+            self.send("bestmove 0000")
+
+    '''
+    Called after every completed depth. A ponderhit that came before iterativeDeepening set its
+    deadline was overwritten there, so its deadline is applied again here.
+    '''
+    def report(self, gs, info):
+        if self.ponderDeadline is not None:
+            self.search.deadline = self.ponderDeadline
+        self.sendInfo(gs, info)
+
+    def sendInfo(self, gs, info):
+        self.send("info depth %d score %s nodes %d nps %d time %d pv %s" % (
+            info['depth'], uciScore(info['score']), info['nodes'], info['nps'], info['timeMs'],
+            " ".join(chessSearch.pvToUci(gs, info['pv']))))
+
+    '''
+    Stops a running search (its bestmove is still sent) and waits for the worker to finish.
+    '''
+    def waitForSearch(self):
+        if self.job is not None:
+            self.stopEvent.set()
+            self.released.set()
+            self.job.result()
+            self.job = None
+
+
+'''
+The legal move code for a UCI move string such as e2e4 or e7e8q, or 0 if there is none.
+'''
+def findMoveCode(gs, uci):
+    for code in gs.getValidMoveCodes([]):
+        if chessEngine.Move.fromCode(code, gs.board).getUciNotation() == uci:
+            return code
+    return 0
+
+'''
+Milliseconds to spend on this move - movetime if given, else a share of the remaining clock
+plus most of the increment, never more than half the clock. Without the mover's clock the
+other side's is used, and without either defaultMoveTimeMs - unless depth is given, then None.
+'''
+def allocateTime(options, whiteToMove):
+    if "movetime" in options:
+        return options["movetime"]
+    side, other = ("wtime", "btime") if whiteToMove else ("btime", "wtime")
+    if side not in options:
+        if other not in options:
+            return None if "depth" in options else defaultMoveTimeMs
+        side = other
+    remaining = options[side]
+    increment = options.get("winc" if side == "wtime" else "binc", 0)
+    budget = remaining // max(1, options.get("movestogo", 30)) + increment * 3 // 4
+    return max(1, min(budget, remaining // 2))
+
+'''
+A search score as UCI "cp N" or "mate N" (N in moves, negative when being mated).
+'''
+def uciScore(score):
+    if abs(score) >= mateScore - maxPly:
+        plies = mateScore - abs(score)
+        moves = (plies + 1) // 2
+        return "mate " + str(moves if score > 0 else -moves)
+    return "cp " + str(score)
+
+
+'''
+Reads commands until quit or end of input. stdin is read on a helper thread so the loop
+(and with it the command handling) stays free while a line is awaited.
+'''
+async def readCommands(engine, stream=None):
+    stream = stream if stream is not None else sys.stdin
+    loop = asyncio.get_running_loop()
+    while True:
+        line = await loop.run_in_executor(None, stream.readline)
+        if not line:
+            engine.handle("quit")
+            break
+        if not engine.handle(line.strip()):
+            break
+
+
+def main():
+    chessProfile.enableFromEnvironment()
+    asyncio.run(readCommands(UciEngine()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
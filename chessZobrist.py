@@ -0,0 +1,34 @@
+"""
+Zobrist keys for identifying positions.
+Every (piece, square), the side to move, each castling-rights mask and each en passant file
+gets a random 64-bit number; a position's key is the XOR of the numbers that apply to it,
+so GameState can update it with a few XORs per move.
+"""
+
+import random
+
+from chessBitboard import pieceNames
+
+# Fixed seed - keys must be identical in every process (shared transposition tables, stored results).
+rng = random.Random(0x5EED)
+pieceKeys = {piece: [rng.getrandbits(64) for _ in range(64)] for piece in pieceNames}
+sideKey = rng.getrandbits(64) # XORed in when black is to move
+castleKeys = [rng.getrandbits(64) for _ in range(16)] # Indexed by GameState.castleRights
+enPassantKeys = [rng.getrandbits(64) for _ in range(8)] # Indexed by the en passant column
+
+'''
+Full recomputation from the board - used to set up a position and by GameState's debug mode.
+'''
+def computeHash(gs):
+    key = 0
+    for r in range(8):
+        for c in range(8):
+            piece = gs.board[r][c]
+            if piece != "--":
+                key ^= pieceKeys[piece][r * 8 + c]
+    if not gs.whitetoMove:
+        key ^= sideKey
+    key ^= castleKeys[gs.castleRights]
+    if gs.enPassantPossible:
+        key ^= enPassantKeys[gs.enPassantPossible[1]]
+    return key